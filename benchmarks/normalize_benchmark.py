@@ -0,0 +1,66 @@
+"""Compare the legacy float64 normalization with normalize_to_uint8.
+
+Run from the repository root:
+
+    python -m benchmarks.normalize_benchmark [--shape 96 1024 1024]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.normalize import normalize_to_uint8
+
+
+def legacy_normalize(img: np.ndarray) -> np.ndarray:
+    """TomocubeImage.process before the chunked normalization engine"""
+    normalized = (img - np.min(img)) / (np.max(img) - np.min(img)) * 255
+    return normalized.astype(np.uint8)
+
+
+def measure(function, img, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(img)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = function(img)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shape", type=int, nargs=3, default=(96, 1024, 1024))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    img = np.random.default_rng(0).normal(1.34, 0.02, args.shape)
+    img = img.astype(np.float32)
+    print(f"HT volume {img.shape} {img.dtype}, {img.nbytes / 1024**2:.0f} MiB")
+
+    legacy_time, legacy_peak, legacy = measure(
+        legacy_normalize, img, args.repeat
+    )
+    new_time, new_peak, new = measure(normalize_to_uint8, img, args.repeat)
+
+    for name, seconds, peak in (
+        ("legacy", legacy_time, legacy_peak),
+        ("normalize_to_uint8", new_time, new_peak),
+    ):
+        print(
+            f"{name:>20}: {seconds * 1000:8.1f} ms, "
+            f"peak allocation {peak / 1024**2:8.1f} MiB"
+        )
+    print(
+        "max abs difference:",
+        np.abs(legacy.astype(np.int16) - new.astype(np.int16)).max(),
+    )
+
+
+if __name__ == "__main__":
+    main()
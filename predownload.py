@@ -0,0 +1,255 @@
+"""Download every image of a project into the local image cache.
+
+Warm the server before a labelling sprint, e.g. overnight:
+
+    python predownload.py project_name [--workers 4] [--image-type HOLOTOMOGRAPHY]
+
+Files already cached with a matching checksum are skipped and interrupted
+downloads resume from their partial file, so the command can be rerun.
+"""
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from googleapiclient.errors import HttpError
+
+from src.database import query_database
+from src.drive_index import get_drive_index
+from src.gdrive import GDRIVE_POOL_SIZE, GDriveCredential, GDriveDownloaderPool
+from src.image import ImageType
+from src.image_cache import image_cache
+from src.volume import ChunkedVolume, HTVolume
+
+PREDOWNLOAD_MAX_ATTEMPTS = int(os.getenv("PREDOWNLOAD_MAX_ATTEMPTS", "8"))
+PREDOWNLOAD_MAX_BACKOFF = float(os.getenv("PREDOWNLOAD_MAX_BACKOFF", "64"))
+PREDOWNLOAD_REPORT_SECONDS = float(
+    os.getenv("PREDOWNLOAD_REPORT_SECONDS", "10")
+)
+
+RATE_LIMIT_REASONS = (b"rateLimitExceeded", b"userRateLimitExceeded")
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, ValueError):
+        # md5 mismatch, the corrupt download is already discarded
+        return True
+    if not isinstance(error, HttpError):
+        return isinstance(error, (ConnectionError, TimeoutError))
+    status = error.resp.status
+    return (
+        (status == 429)
+        | (status >= 500)
+        | (
+            (status == 403)
+            & any(
+                reason in (error.content or b"")
+                for reason in RATE_LIMIT_REASONS
+            )
+        )
+    )
+
+
+class Backoff:
+    """Exponential backoff with jitter shared by every worker.
+
+    A rate limit answer to one worker pauses all of them, since Drive
+    quotas apply to the whole user.
+    """
+
+    def __init__(self, max_backoff=PREDOWNLOAD_MAX_BACKOFF):
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.resume_at = 0.0
+
+    def wait(self):
+        with self.lock:
+            delay = self.resume_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def failed(self, attempt: int):
+        delay = min(2**attempt + random.random(), self.max_backoff)
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.time() + delay)
+
+    def call(self, function, *args, **kwargs):
+        for attempt in range(PREDOWNLOAD_MAX_ATTEMPTS):
+            self.wait()
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:
+                if (not is_retryable(error)) | (
+                    attempt == PREDOWNLOAD_MAX_ATTEMPTS - 1
+                ):
+                    raise
+                logging.warning(f"Retry after {error!r}")
+                self.failed(attempt)
+
+
+class Progress:
+    def __init__(self, total_files: int, total_bytes: int):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.last_report = 0.0
+        self.done = 0
+        self.cached = 0
+        self.failed = 0
+        self.done_bytes = 0
+        self.downloaded_bytes = 0
+
+    def update(self, size: int, cached=False, failed=False):
+        with self.lock:
+            self.done += 1
+            self.cached += cached
+            self.failed += failed
+            self.done_bytes += size
+            if not (cached | failed):
+                self.downloaded_bytes += size
+            if time.time() - self.last_report >= PREDOWNLOAD_REPORT_SECONDS:
+                self.report()
+
+    def report(self):
+        self.last_report = time.time()
+        elapsed = max(self.last_report - self.start, 1e-6)
+        rate = self.downloaded_bytes / elapsed
+        remaining = self.total_bytes - self.done_bytes
+        eta = f"{remaining / rate / 60:.0f} min" if rate > 0 else "-"
+        logging.info(
+            f"{self.done}/{self.total_files} files "
+            f"({self.cached} cached, {self.failed} failed), "
+            f"{self.done_bytes / 1024**3:.1f}/{self.total_bytes / 1024**3:.1f} GiB, "
+            f"{rate / 1024**2:.1f} MiB/s, ETA {eta}"
+        )
+
+
+def get_project_images(project_name: str, image_types=None) -> list[dict]:
+    image_type_filter = (
+        "AND image_type IN %s" if image_types is not None else ""
+    )
+    return list(
+        query_database(
+            f"""SELECT DISTINCT google_drive_file_id, image_type
+                FROM {project_name}_image
+                WHERE google_drive_file_id IS NOT NULL
+                {image_type_filter}""",
+            (tuple(image_types),) if image_types is not None else None,
+        )
+    )
+
+
+def predownload(project_name: str, workers: int, image_types=None):
+    images = get_project_images(project_name, image_types)
+    downloader = GDriveDownloaderPool(GDriveCredential(), size=workers)
+    backoff = Backoff()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        logging.info(f"Read Drive metadata of {len(images)} files")
+        index = get_drive_index()
+        with downloader.acquire() as drive:
+            backoff.call(index.sync, drive.service)
+            metadata = backoff.call(
+                index.lookup,
+                drive.service,
+                [image["google_drive_file_id"] for image in images],
+            )
+        # files the batch lookup could not get are retried one by one
+        futures = {
+            executor.submit(
+                backoff.call,
+                downloader.get_metadata,
+                image["google_drive_file_id"],
+            ): image
+            for image in images
+            if image["google_drive_file_id"] not in metadata
+        }
+        for future in as_completed(futures):
+            image = futures[future]
+            try:
+                metadata[image["google_drive_file_id"]] = future.result()
+            except Exception:
+                logging.exception(
+                    f"Failed to read metadata of {image['google_drive_file_id']}"
+                )
+
+        total_bytes = sum(int(m.get("size", 0)) for m in metadata.values())
+        if total_bytes > image_cache.max_bytes:
+            logging.warning(
+                f"{project_name} needs {total_bytes / 1024**3:.1f} GiB, more than "
+                f"IMAGE_CACHE_MAX_BYTES ({image_cache.max_bytes / 1024**3:.1f} GiB); "
+                "the earliest downloads will be evicted"
+            )
+        progress = Progress(len(images), total_bytes)
+        for _ in range(len(images) - len(metadata)):
+            progress.update(0, failed=True)
+
+        def download(image):
+            file_id = image["google_drive_file_id"]
+            cached = image_cache.lookup(file_id, metadata[file_id]) is not None
+            if not cached:
+                backoff.call(
+                    image_cache.fetch,
+                    downloader,
+                    file_id,
+                    metadata=metadata[file_id],
+                    verify=True,
+                )
+            image_path = image_cache.path(file_id)
+            if (image["image_type"] == ImageType.HOLOTOMOGRAPHY.name) and (
+                HTVolume.is_supported(image_path)
+            ):
+                # build the chunked copy now instead of on first view
+                ChunkedVolume.from_tiff(image_path)
+            return cached
+
+        futures = {
+            executor.submit(download, image): image
+            for image in images
+            if image["google_drive_file_id"] in metadata
+        }
+        for future in as_completed(futures):
+            image = futures[future]
+            size = int(metadata[image["google_drive_file_id"]].get("size", 0))
+            try:
+                progress.update(size, cached=future.result())
+            except Exception:
+                logging.exception(
+                    f"Failed to download {image['google_drive_file_id']}"
+                )
+                progress.update(size, failed=True)
+
+    progress.report()
+    return progress.failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download every image of a tomocube project into the image cache"
+    )
+    parser.add_argument("project_name")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=GDRIVE_POOL_SIZE,
+        help="concurrent Drive downloads",
+    )
+    parser.add_argument(
+        "--image-type",
+        choices=[image_type.name for image_type in ImageType],
+        action="append",
+        help="image types to download, all image types if omitted",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not predownload(args.project_name, args.workers, args.image_type):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+from collections import OrderedDict, defaultdict
+
+from src.database import query_cache, query_database
+from src.label_queue import get_label_queue
+from src.pending_index import LABEL_TYPES, ensure_pending_index, pending_table
+
+
+class ProjectCellIndex:
+    """In-memory patient -> cell type -> cell number tree of a project.
+
+    Every cell carries the ids of its unlabelled images per label type, so
+    the filtered selectors read the same tree. Labels still waiting in the
+    label queue are applied on every read, so a cell drops out of the
+    filtered selectors as soon as it is labelled, before the write lands.
+    """
+
+    def __init__(self, project_name: str, rows, pending_images: dict):
+        self.project_name = project_name
+        self.tree = OrderedDict()
+        for row in rows:
+            cell_types = self.tree.setdefault(row["patient_id"], OrderedDict())
+            if row["cell_type"] is None:
+                continue
+            cell_types.setdefault(row["cell_type"], []).append(
+                (
+                    row["cell_number"],
+                    {
+                        label_type: pending_images[label_type].get(
+                            row["cell_id"], frozenset()
+                        )
+                        for label_type in LABEL_TYPES
+                    },
+                )
+            )
+
+    @classmethod
+    def load(cls, project_name: str):
+        pending_images = {}
+        for label_type in LABEL_TYPES:
+            ensure_pending_index(project_name, label_type)
+            cells = defaultdict(set)
+            for row in query_database(
+                f"""SELECT cell_id, image_id
+                FROM {pending_table(project_name, label_type)}"""
+            ):
+                cells[row["cell_id"]].add(row["image_id"])
+            pending_images[label_type] = {
+                cell_id: frozenset(image_ids)
+                for cell_id, image_ids in cells.items()
+            }
+        return cls(
+            project_name,
+            query_database(
+                f"""SELECT p.patient_id, c.cell_id, c.cell_type, c.cell_number
+                FROM {project_name}_patient p
+                LEFT JOIN {project_name}_cell c
+                ON c.patient_id = p.patient_id
+                ORDER BY p.patient_id, c.cell_type, c.cell_number"""
+            ),
+            pending_images,
+        )
+
+    def _queued(self, label_type) -> set:
+        if label_type is None:
+            return set()
+        return get_label_queue().queued_image_ids(
+            self.project_name, label_type
+        )
+
+    @staticmethod
+    def _is_pending(pending, label_type, queued) -> bool:
+        return len(pending[label_type] - queued) > 0
+
+    def patient_ids(self, label_type=None) -> list:
+        queued = self._queued(label_type)
+        return [
+            patient_id
+            for patient_id, cell_types in self.tree.items()
+            if (label_type is None)
+            or any(
+                self._is_pending(pending, label_type, queued)
+                for cells in cell_types.values()
+                for _, pending in cells
+            )
+        ]
+
+    def cell_types(self, patient_id, label_type=None) -> list:
+        queued = self._queued(label_type)
+        return [
+            cell_type
+            for cell_type, cells in self.tree.get(patient_id, {}).items()
+            if (label_type is None)
+            or any(
+                self._is_pending(pending, label_type, queued)
+                for _, pending in cells
+            )
+        ]
+
+    def cell_numbers(self, patient_id, cell_type, label_type=None) -> list:
+        queued = self._queued(label_type)
+        return [
+            cell_number
+            for cell_number, pending in self.tree.get(patient_id, {}).get(
+                cell_type, []
+            )
+            if (label_type is None)
+            or self._is_pending(pending, label_type, queued)
+        ]
+
+
+def get_cell_index(project_name: str) -> ProjectCellIndex:
+    """Return the cached index, reloaded after a label write to the project"""
+    return query_cache.get_or_load(
+        ("cell_index", project_name),
+        project_name,
+        lambda: ProjectCellIndex.load(project_name),
+    )
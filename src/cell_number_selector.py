@@ -3,7 +3,7 @@ from sqlite3 import sqlite_version_info
 
 import streamlit as st
 
-from src.database import query_database
+from src.cell_index import get_cell_index
 from src.renderer import return_selectbox_result
 
 
@@ -22,13 +22,11 @@ class CellNumberRenderer:
         )
 
     def get_data_list(self):
-        sql = f"""SELECT cell_number 
-                FROM {self.project_name}_cell 
-                WHERE cell_type = '{self.cell_type}' 
-                AND patient_id = {self.patient_id} 
-                ORDER BY cell_number"""
-
-        return return_selectbox_result([data["cell_number"] for data in query_database(sql)])  # type: ignore
+        return return_selectbox_result(
+            get_cell_index(self.project_name).cell_numbers(
+                self.patient_id, self.cell_type
+            )
+        )
 
     def render(self):
         return st.selectbox(self.name, self.data_list, index=0)
@@ -39,48 +37,18 @@ class FilterCellNumberRenderer(CellNumberRenderer):
         self.label_type = label_type
         super().__init__(name, project_name, patient_id, cell_type)
 
-
-class FilterQualityCellNumberRenderer(FilterCellNumberRenderer):
     def get_data_list(self):
-        sql = f"""SELECT distinct(cell_number) 
-                FROM {self.project_name}_cell 
-                WHERE cell_type = '{self.cell_type}' 
-                AND patient_id = {self.patient_id} 
-                AND cell_id IN 
-                    (SELECT distinct(cell_id) FROM {self.project_name}_image WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type})) 
-                ORDER BY cell_number"""
-
-        logging.info(sql)
-        logging.info([data["cell_number"] for data in query_database(sql)])
-
-        return return_selectbox_result(
-            [data["cell_number"] for data in query_database(sql)]
-        )
-
-
-class FilterCenterCellNumberRenderer(FilterCellNumberRenderer):
-    def get_data_list(self):
-        sql = f"""SELECT distinct(cell_number) 
-                FROM {self.project_name}_cell 
-                WHERE cell_type = '{self.cell_type}' 
-                AND patient_id = {self.patient_id} 
-                AND cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type})
-                    AND image_type = 'HOLOTOMOGRAPHY') 
-                ORDER BY cell_number"""
-        logging.info(sql)
-        logging.info([data["cell_number"] for data in query_database(sql)])
-        return return_selectbox_result(
-            [data["cell_number"] for data in query_database(sql)]
+        data_list = get_cell_index(self.project_name).cell_numbers(
+            self.patient_id, self.cell_type, self.label_type
         )
+        logging.info(data_list)
+        return return_selectbox_result(data_list)
 
 
 class CellNumberRendererFactory:
     factory_dict = {
-        "quality": FilterQualityCellNumberRenderer,
-        "center": FilterCenterCellNumberRenderer,
+        "quality": FilterCellNumberRenderer,
+        "center": FilterCellNumberRenderer,
     }
 
     def get_renderer(
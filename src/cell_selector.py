@@ -45,15 +45,17 @@ def render_cell_selector(label_type):
             )
             .render()
         )
-        st.session_state[f"{label_type}_cell_number"] = (
-            CellNumberRendererFactory()
-            .get_renderer(
-                "Cell Number",
-                st.session_state[f"{label_type}_project_name"],
-                st.session_state[f"{label_type}_patient_id"],
-                st.session_state[f"{label_type}_cell_type"],
-                st.session_state[f"{label_type}_filter_labeled"],
-                label_type,
-            )
-            .render()
+        cell_number_renderer = CellNumberRendererFactory().get_renderer(
+            "Cell Number",
+            st.session_state[f"{label_type}_project_name"],
+            st.session_state[f"{label_type}_patient_id"],
+            st.session_state[f"{label_type}_cell_type"],
+            st.session_state[f"{label_type}_filter_labeled"],
+            label_type,
         )
+        st.session_state[
+            f"{label_type}_cell_number_list"
+        ] = cell_number_renderer.data_list
+        st.session_state[
+            f"{label_type}_cell_number"
+        ] = cell_number_renderer.render()
@@ -1,6 +1,6 @@
 import streamlit as st
 
-from src.database import query_database
+from src.cell_index import get_cell_index
 from src.renderer import return_selectbox_result
 
 
@@ -12,12 +12,8 @@ class CellTypeRenderer:
         self.data_list = self.get_data_list() if patient_id is not None else []
 
     def get_data_list(self):
-        sql = f"""SELECT distinct(cell_type) 
-                FROM {self.project_name}_cell 
-                WHERE patient_id = {self.patient_id} 
-                ORDER BY cell_type"""
         return return_selectbox_result(
-            [data["cell_type"] for data in query_database(sql)]
+            get_cell_index(self.project_name).cell_types(self.patient_id)
         )
 
     def render(self):
@@ -31,40 +27,18 @@ class FilterCellTypeRenderer(CellTypeRenderer):
         self.label_type = label_type
         super().__init__(name, project_name, patient_id)
 
-
-class FilterQualityCellTypeRenderer(FilterCellTypeRenderer):
-    def get_celltype_list(self):
-        sql = f"""SELECT distinct(cell_type) 
-                FROM {self.project_name}_cell 
-                WHERE patient_id = {self.patient_id} 
-                AND cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type}))
-                ORDER BY cell_type"""
-
-        return return_selectbox_result([data["cell_type"] for data in query_database(sql)])  # type: ignore
-
-
-class FilterCenterCellTypeRenderer(FilterCellTypeRenderer):
-    def get_celltype_list(self):
-        sql = f"""SELECT distinct(cell_type) 
-                FROM {self.project_name}_cell 
-                WHERE patient_id = {self.patient_id} 
-                AND cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type})
-                    AND image_type = 'HOLOTOMOGRAPHY' )
-                ORDER BY cell_type"""
-
-        return return_selectbox_result([data["cell_type"] for data in query_database(sql)])  # type: ignore
+    def get_data_list(self):
+        return return_selectbox_result(
+            get_cell_index(self.project_name).cell_types(
+                self.patient_id, self.label_type
+            )
+        )
 
 
 class CellTypeRendererFactory:
     factory_dict = {
-        "quality": FilterQualityCellTypeRenderer,
-        "center": FilterCenterCellTypeRenderer,
+        "quality": FilterCellTypeRenderer,
+        "center": FilterCellTypeRenderer,
     }
 
     def get_renderer(
@@ -6,11 +6,28 @@ import streamlit as st
 from streamlit_custom_image_labeller import st_custom_image_labeller
 
 from src.cell_selector import render_cell_selector
-from src.database import Database, query_database
-from src.gdrive import GDriveCredential, GDriveDownloader
-from src.image import TomocubeImage, download_image, get_images
-from src.renderer import LabelProgressRenderer, TitleRenderer
+from src.database import query_database
+from src.image import ImageType, download_image, get_images
+from src.label_queue import get_label_queue
+from src.prefetch import ImagePrefetcher
+from src.renderer import (
+    LabelProgressRenderer,
+    PendingLabelRenderer,
+    RerunTimingRenderer,
+    SliceCacheRenderer,
+    TitleRenderer,
+)
+from src.rerun import fragment, rerun_app, timed
 from src.session import set_session_state
+from src.slice_cache import (
+    CENTER_STACK_WIDTH,
+    pyramid_factor,
+    render_slice,
+    render_stack,
+    to_display,
+    to_voxel,
+)
+from src.storage import get_storage
 
 
 @dataclass
@@ -39,60 +56,115 @@ def set_default_point(
     st.session_state["point"] = Point(x, y, z)
 
 
-def render_center_labeller(image: np.ndarray):
+def render_center_labeller(image: np.ndarray, google_file_id: str):
     col1, col2 = st.columns(2)
+    point = st.session_state["point"]
 
     with col1:
         st.header("HT - XY")
-        logging.info(f"render col1 - {st.session_state['point']}")
+        logging.info(f"render col1 - {point}")
+        # numpy array axis is not matching with mouse point axis
+        factor = pyramid_factor(image.shape[2])
+        display_point = (
+            to_display(point.y, factor),
+            to_display(point.x, factor),
+        )
         output = st_custom_image_labeller(
-            TomocubeImage.numpy_to_image(
-                TomocubeImage.slice_axis(
-                    image, idx=st.session_state["point"].z, axis=0
-                )
+            render_slice(
+                image, google_file_id, idx=point.z, axis=0, factor=factor
             ),
             point_color="red",
-            point=(
-                st.session_state["point"].y,
-                st.session_state["point"].x,
-            ),  # numpy array axis is not matching with mouse point axis
+            point=display_point,
         )
-        st.session_state["point"].y = output[
-            "x"
-        ]  # numpy array axis is not matching with mouse point axis
-        st.session_state["point"].x = output[
-            "y"
-        ]  # numpy array axis is not matching with mouse point axis
+        # a display pixel covers several voxels, so only a new click moves
+        # the point instead of snapping it to the pixel center on each rerun
+        if (output["x"], output["y"]) != display_point:
+            point.y = to_voxel(output["x"], factor, image.shape[2])
+            point.x = to_voxel(output["y"], factor, image.shape[1])
 
     with col2:
         st.header("HT - YZ")
-        logging.info(f"render col2 - {st.session_state['point']}")
+        logging.info(f"render col2 - {point}")
+        factor = pyramid_factor(image.shape[1])
+        display_point = (
+            to_display(point.x, factor),
+            to_display(point.z, factor),
+        )
         output2 = st_custom_image_labeller(
-            TomocubeImage.numpy_to_image(
-                TomocubeImage.slice_axis(
-                    image, idx=st.session_state["point"].y, axis=2
-                )
+            render_slice(
+                image, google_file_id, idx=point.y, axis=2, factor=factor
             ),
             point_color="red",
-            point=(st.session_state["point"].x, st.session_state["point"].z),
+            point=display_point,
+        )
+
+        if (output2["x"], output2["y"]) != display_point:
+            point.z = to_voxel(output2["y"], factor, image.shape[0])
+
+
+def render_center_stack_labeller(image: np.ndarray, google_file_id: str):
+    """Ship each view as a slice stack and scroll it in the browser"""
+    col1, col2 = st.columns(2)
+    point = st.session_state["point"]
+
+    with col1:
+        st.header("HT - XY")
+        factor = pyramid_factor(image.shape[2], CENTER_STACK_WIDTH)
+        display_point = (
+            to_display(point.y, factor),
+            to_display(point.x, factor),
+        )
+        output = st_custom_image_labeller(
+            render_stack(image, google_file_id, axis=0, factor=factor),
+            point_color="red",
+            point=display_point,
+            key="center_xy_stack",
+            slice_count=image.shape[0],
+            slice_index=point.z,
         )
+        # a scroll reports only a new index, which must not snap x and y
+        # to the center of their display pixel
+        if (output["x"], output["y"]) != display_point:
+            point.y = to_voxel(output["x"], factor, image.shape[2])
+            point.x = to_voxel(output["y"], factor, image.shape[1])
+        point.z = output["index"]
 
-        st.session_state["point"].z = output2["y"]
+    with col2:
+        st.header("HT - YZ")
+        factor = pyramid_factor(image.shape[1], CENTER_STACK_WIDTH)
+        display_point = (
+            to_display(point.x, factor),
+            to_display(point.z, factor),
+        )
+        output2 = st_custom_image_labeller(
+            render_stack(image, google_file_id, axis=2, factor=factor),
+            point_color="red",
+            point=display_point,
+            key="center_yz_stack",
+            slice_count=image.shape[2],
+            slice_index=point.y,
+        )
+        if (output2["x"], output2["y"]) != display_point:
+            point.x = to_voxel(output2["x"], factor, image.shape[1])
+            point.z = to_voxel(output2["y"], factor, image.shape[0])
+        point.y = output2["index"]
 
 
-def render_morphology_all_axis(image: np.ndarray) -> None:
+def render_morphology_all_axis(image: np.ndarray, google_file_id: str) -> None:
     st.subheader("Morphology")
 
     col1, col2, col3 = st.columns(3)
     with col1:
-        _render_each_axis(image, 0)
+        _render_each_axis(image, google_file_id, 0)
     with col2:
-        _render_each_axis(image, 1)
+        _render_each_axis(image, google_file_id, 1)
     with col3:
-        _render_each_axis(image, 2)
+        _render_each_axis(image, google_file_id, 2)
 
 
-def _render_each_axis(image: np.ndarray, axis: int) -> None:
+def _render_each_axis(
+    image: np.ndarray, google_file_id: str, axis: int
+) -> None:
     factory = {0: "z", 1: "x", 2: "y"}
     slider_value = st.slider(
         f"{factory[axis]}-axis",
@@ -102,12 +174,43 @@ def _render_each_axis(image: np.ndarray, axis: int) -> None:
     )
 
     st.image(
-        TomocubeImage.image_for_streamlit(image, idx=slider_value, axis=axis),
-        use_column_width=True,
+        render_slice(image, google_file_id, idx=slider_value, axis=axis),
+        use_container_width=True,
         clamp=True,
     )
 
 
+@fragment
+def render_labeller_panel(
+    project_name: str, image: np.ndarray, google_file_id: str
+):
+    # a point click reruns only this panel, not the selectors and queries
+    with timed("center labeller panel"):
+        if st.checkbox("Scroll slices in the browser", value=False):
+            render_center_stack_labeller(image, google_file_id)
+        else:
+            render_center_labeller(image, google_file_id)
+
+        st.write(
+            f"The coordinates of center point: ({st.session_state['point'].x}, {st.session_state['point'].y}, {st.session_state['point'].z})"
+        )
+
+        if st.button(
+            "Save Point",
+            on_click=save_point,
+            args=(project_name,),
+        ):
+            # the selectors and progress outside this panel show the save
+            rerun_app()
+
+
+@fragment
+def render_morphology_panel(image: np.ndarray, google_file_id: str):
+    with timed("morphology panel"):
+        if st.checkbox("Show all axis", value=False):
+            render_morphology_all_axis(image, google_file_id)
+
+
 def save_point(project_name):
     _write_to_database(
         project_name,
@@ -119,16 +222,19 @@ def save_point(project_name):
 
 
 def _write_to_database(project_name, image_id, x, y, z):
-    database = Database()
-    sql = f"INSERT INTO {project_name}_image_center (image_id, x, y, z) VALUES ({image_id}, {x}, {y}, {z}) ON DUPLICATE KEY UPDATE x = {x}, y = {y}, z = {z}"
-    database.execute_sql(sql)
-    database.conn.commit()
-    database.conn.close()
-    del database
+    get_label_queue().put(
+        project_name,
+        "center",
+        [{"image_id": image_id, "x": x, "y": y, "z": z}],
+    )
 
 
 def app():
-    downloader = GDriveDownloader(GDriveCredential().credentials)
+    with timed("center labeller page"):
+        _app()
+
+
+def _app():
     set_session_state(
         "center_filter_labeled",
         "center_project_name",
@@ -139,6 +245,10 @@ def app():
     st.session_state["center_filter_labeled"] = True
 
     set_session_state("ht_image_meta_center", "ht_image")
+    if "center_prefetcher" not in st.session_state:
+        st.session_state["center_prefetcher"] = ImagePrefetcher(
+            (ImageType.HOLOTOMOGRAPHY,)
+        )
 
     TitleRenderer("Tomocube Image Quality Labeller").render()
 
@@ -163,11 +273,26 @@ def app():
     if ht != st.session_state["ht_image_meta_center"]:
         if ht is not None:
             download_image(
-                downloader, ht.image_google_id, "image", "ht.tiff", "ht_image"
+                get_storage(st.session_state["center_project_name"]),
+                ht.image_google_id,
+                "ht_image",
+                st.session_state["center_prefetcher"],
             )
         st.session_state["ht_image_meta_center"] = ht
+    st.session_state["center_prefetcher"].schedule(
+        st.session_state["center_project_name"],
+        st.session_state["center_patient_id"],
+        st.session_state["center_cell_type"],
+        st.session_state["center_cell_number_list"],
+        st.session_state["center_cell_number"],
+    )
     logging.info(st.session_state["ht_image_meta_center"])
 
+    if st.session_state["ht_image_meta_center"] is None:
+        st.write("Not Available HT image")
+        st.write("The selected cell has no holotomography image to label.")
+        return
+
     if "point" not in st.session_state:
         set_default_point(
             st.session_state["center_project_name"],
@@ -175,22 +300,20 @@ def app():
             st.session_state["ht_image"].shape,
         )
 
-    render_center_labeller(st.session_state["ht_image"])
-
-    st.write(
-        f"The coordinates of center point: ({st.session_state['point'].x}, {st.session_state['point'].y}, {st.session_state['point'].z})"
+    render_labeller_panel(
+        st.session_state["center_project_name"],
+        st.session_state["ht_image"],
+        st.session_state["ht_image_meta_center"].image_google_id,
     )
-
-    st.button(
-        "Save Point",
-        on_click=save_point,
-        args=(st.session_state["center_project_name"],),
+    render_morphology_panel(
+        st.session_state["ht_image"],
+        st.session_state["ht_image_meta_center"].image_google_id,
     )
 
-    if st.checkbox("Show all axis", value=False):
-        render_morphology_all_axis(st.session_state["ht_image"])
-
     with st.sidebar:
         LabelProgressRenderer(
             st.session_state["center_project_name"], "center"
         ).render()
+        PendingLabelRenderer(st.session_state["center_project_name"]).render()
+        SliceCacheRenderer().render()
+        RerunTimingRenderer().render()
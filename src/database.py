@@ -1,4 +1,9 @@
 import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 
 import pymysql
 from dotenv import load_dotenv
@@ -6,14 +11,30 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MYSQL_HOST = os.getenv("MYSQL_HOST")
-MYSQL_PORT = int(os.getenv("MYSQL_PORT"))
+MYSQL_PORT = int(os.getenv("MYSQL_PORT", "3306"))
 MYSQL_DB = os.getenv("MYSQL_DB")
 MYSQL_USER = os.getenv("MYSQL_USER")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
 MYSQL_CHARSET = os.getenv("MYSQL_CHARSET")
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "5"))
+MYSQL_POOL_MAX_IDLE = float(os.getenv("MYSQL_POOL_MAX_IDLE", "300"))
+MYSQL_POOL_PING_AFTER = float(os.getenv("MYSQL_POOL_PING_AFTER", "30"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+# "mysql" or "sqlite" for a local database file at SQLITE_DATABASE_PATH
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "mysql")
+SQLITE_DATABASE_PATH = os.getenv("SQLITE_DATABASE_PATH", "tomocube.sqlite")
 
 
-class Database:
+class ConnectionPool:
+    """Bounded, thread-safe pool of PyMySQL connections.
+
+    A connection idle for more than ``ping_after`` seconds is pinged before
+    it is handed out, and one idle for more than ``max_idle`` seconds is
+    closed and replaced. Connections run in autocommit mode so a reused
+    connection never reads from a stale transaction snapshot.
+    """
+
     def __init__(
         self,
         host=MYSQL_HOST,
@@ -22,30 +43,347 @@ class Database:
         user=MYSQL_USER,
         password=MYSQL_PASSWORD,
         charset=MYSQL_CHARSET,
+        size=MYSQL_POOL_SIZE,
+        max_idle=MYSQL_POOL_MAX_IDLE,
+        ping_after=MYSQL_POOL_PING_AFTER,
     ):
-        self.conn = self.create_connection(
-            host, port, db, user, password, charset
-        )
-        self.cursor = self.conn.cursor(pymysql.cursors.DictCursor)
-
-    def create_connection(self, host, port, db, user, password, charset):
-        return pymysql.connect(
+        self.connect_kwargs = dict(
             host=host,
             port=port,
             db=db,
             user=user,
             password=password,
             charset=charset,
-        )  # type: ignore
+            autocommit=True,
+        )
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def create_connection(self):
+        return pymysql.connect(**self.connect_kwargs)  # type: ignore
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self._checkout()
+        except Exception:
+            self.slots.release()
+            raise
+
+    def _checkout(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, last_used = self.idle.pop()
+            idle_time = time.monotonic() - last_used
+            if idle_time > self.max_idle:
+                self._close(conn)
+                continue
+            if idle_time > self.ping_after:
+                try:
+                    conn.ping(reconnect=False)
+                except pymysql.err.Error:
+                    self._close(conn)
+                    continue
+            return conn
+        return self.create_connection()
+
+    def release(self, conn, discard=False):
+        try:
+            if discard or not conn.open:
+                self._close(conn)
+            else:
+                with self.lock:
+                    self.idle.append((conn, time.monotonic()))
+        finally:
+            self.slots.release()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except pymysql.err.Error:
+            pass
+
+
+CONNECTION_ERRORS = (
+    pymysql.err.OperationalError,
+    pymysql.err.InterfaceError,
+    sqlite3.OperationalError,
+)
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def to_sqlite_sql(sql: str, args=None):
+    """Translate PyMySQL paramstyle to SQLite.
+
+    ``%s`` becomes ``?`` and ``%(name)s`` becomes ``:name``. A tuple or list
+    argument expands to ``(?, ?, ...)`` like PyMySQL renders it, so
+    ``IN %s`` queries work unchanged.
+    """
+    if args is None:
+        return sql, ()
+    if isinstance(args, dict):
+        return (
+            _PLACEHOLDER.sub(
+                lambda m: f":{m.group(1)}" if m.group(1) else "%", sql
+            ),
+            args,
+        )
+
+    args = iter(args)
+    params = []
+
+    def placeholder(match):
+        if match.group(0) == "%%":
+            return "%"
+        arg = next(args)
+        if isinstance(arg, (tuple, list)):
+            params.extend(arg)
+            return f"({', '.join('?' * len(arg))})"
+        params.append(arg)
+        return "?"
+
+    return _PLACEHOLDER.sub(placeholder, sql), params
+
+
+class SQLiteCursor:
+    """DB-API cursor returning rows as dicts like PyMySQL's DictCursor"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+
+    def execute(self, sql: str, args=None):
+        self.cursor.execute(*to_sqlite_sql(sql, args))
+
+    def executemany(self, sql: str, args_list):
+        converted = [to_sqlite_sql(sql, args) for args in args_list]
+        if converted:
+            self.cursor.executemany(
+                converted[0][0], [params for _, params in converted]
+            )
+
+    def fetchall(self):
+        # an empty result is () as with PyMySQL
+        return tuple(dict(row) for row in self.cursor.fetchall())
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """SQLite connection with the parts of the PyMySQL API the app uses"""
+
+    def __init__(self, path=SQLITE_DATABASE_PATH):
+        # isolation_level None: autocommit unless begin() is called
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA busy_timeout = 5000")
+        self.open = True
+
+    def cursor(self, cursor_class=None):
+        return SQLiteCursor(self.conn.cursor())
+
+    def begin(self):
+        self.conn.execute("BEGIN")
+
+    def commit(self):
+        if self.conn.in_transaction:
+            self.conn.execute("COMMIT")
+
+    def rollback(self):
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
 
-    def execute_sql(self, sql: str):
-        self.cursor.execute(sql)
+    def ping(self, reconnect=False):
+        self.conn.execute("SELECT 1")
+
+    def close(self):
+        self.conn.close()
+        self.open = False
+
+
+class SQLiteConnectionPool(ConnectionPool):
+    def __init__(self, path=SQLITE_DATABASE_PATH, size=MYSQL_POOL_SIZE):
+        super().__init__(size=size)
+        self.path = path
+
+    def create_connection(self):
+        return SQLiteConnection(self.path)
+
+
+def is_sqlite() -> bool:
+    return DATABASE_BACKEND == "sqlite"
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SQLiteConnectionPool() if is_sqlite() else ConnectionPool()
+    return _pool
+
+
+class Database:
+    def __init__(self, pool=None):
+        self.pool = pool if pool is not None else get_pool()
+        self.conn = self.pool.acquire()
+        self.cursor = self.conn.cursor(pymysql.cursors.DictCursor)
+        self.broken = False
+
+    def execute_sql(self, sql: str, args=None):
+        try:
+            self.cursor.execute(sql, args)
+        except CONNECTION_ERRORS:
+            self.broken = True
+            raise
         return self.cursor.fetchall()
 
+    def execute_many(self, sql: str, args_list):
+        try:
+            self.cursor.executemany(sql, args_list)
+        except CONNECTION_ERRORS:
+            self.broken = True
+            raise
+
+    def close(self):
+        self.cursor.close()
+        self.pool.release(self.conn, discard=self.broken)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if (exc_type is not None) & (not self.broken):
+            try:
+                self.conn.rollback()
+            except pymysql.err.Error:
+                self.broken = True
+        self.close()
+
+
+def query_database(sql, args=None):
+    with Database() as database:
+        return database.execute_sql(sql, args)
+
+
+def list_tables(pattern: str, cached=False) -> list[str]:
+    """Names of the tables in the current database matching a LIKE pattern"""
+    if is_sqlite():
+        sql = """SELECT name AS TABLE_NAME
+            FROM sqlite_master
+            WHERE type = 'table'
+            AND name LIKE %s"""
+    else:
+        sql = """SELECT TABLE_NAME
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME LIKE %s"""
+    data_list = (
+        cached_query_database(None, sql, (pattern,))
+        if cached
+        else query_database(sql, (pattern,))
+    )
+    return [data["TABLE_NAME"] for data in data_list]
+
+
+class QueryCache:
+    """TTL and LRU bounded cache of read query results.
+
+    Entries are keyed by whitespace-normalized SQL and its parameters and
+    tagged with the project they read, so a label write only drops the
+    entries of its own project.
+    """
+
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_size=QUERY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generations = {}
+
+    @staticmethod
+    def make_key(sql: str, args=None):
+        if isinstance(args, dict):
+            args = tuple(sorted(args.items()))
+        elif isinstance(args, list):
+            args = tuple(args)
+        return " ".join(sql.split()), args
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, data = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, project_name, data, generation=None):
+        with self.lock:
+            # a write since the load began makes the loaded data stale
+            if (generation is not None) and (
+                generation != self._generation(project_name)
+            ):
+                return
+            self.entries[key] = (
+                time.monotonic() + self.ttl,
+                project_name,
+                data,
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_or_load(self, key, project_name, loader):
+        data = self.get(key)
+        if data is None:
+            with self.lock:
+                generation = self._generation(project_name)
+            data = loader()
+            self.put(key, project_name, data, generation)
+        return data
+
+    def _generation(self, project_name):
+        return self.generations.get(None, 0), self.generations.get(
+            project_name, 0
+        )
+
+    def invalidate(self, project_name=None):
+        """Drop the entries of a project, or every entry if it is None"""
+        with self.lock:
+            self.generations[project_name] = (
+                self.generations.get(project_name, 0) + 1
+            )
+            for key in [
+                key
+                for key, (_, entry_project, _) in self.entries.items()
+                if (project_name is None) | (entry_project == project_name)
+            ]:
+                del self.entries[key]
+
+
+query_cache = QueryCache()
+
 
-def query_database(sql):
-    database = Database()
-    data_list = database.execute_sql(sql)
-    database.conn.close()
-    del database
-    return data_list
+def cached_query_database(project_name, sql, args=None):
+    return query_cache.get_or_load(
+        query_cache.make_key(sql, args),
+        project_name,
+        lambda: query_database(sql, args),
+    )
@@ -0,0 +1,224 @@
+"""Local index of Drive file metadata: id, size, md5Checksum, modifiedTime.
+
+The index is synced incrementally by paging through ``files.list`` with a
+minimal fields mask, so cache validation, download planning and prefetch
+read metadata locally instead of asking Drive file by file. A running app
+resyncs every DRIVE_INDEX_SYNC_SECONDS; sync by hand with
+``python -m src.drive_index [--full]``.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+DRIVE_INDEX_PATH = os.getenv("DRIVE_INDEX_PATH", "drive_index.sqlite")
+DRIVE_INDEX_PAGE_SIZE = int(os.getenv("DRIVE_INDEX_PAGE_SIZE", "1000"))
+# Drive accepts at most 100 calls in one batch request
+DRIVE_INDEX_BATCH_SIZE = int(os.getenv("DRIVE_INDEX_BATCH_SIZE", "100"))
+DRIVE_INDEX_SYNC_SECONDS = float(os.getenv("DRIVE_INDEX_SYNC_SECONDS", "600"))
+
+METADATA_FIELDS = "id, size, md5Checksum, modifiedTime"
+
+
+class DriveIndex:
+    def __init__(self, path=DRIVE_INDEX_PATH):
+        self.lock = threading.Lock()
+        self.sync_thread = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        with self.conn:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS drive_file (
+                    id TEXT PRIMARY KEY,
+                    size INTEGER,
+                    md5Checksum TEXT,
+                    modifiedTime TEXT
+                )"""
+            )
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS drive_sync (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )"""
+            )
+
+    def get(self, file_id: str):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM drive_file WHERE id = ?", (file_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_many(self, file_ids) -> dict:
+        file_ids = list(file_ids)
+        found = {}
+        # stay below the SQLite limit of bound variables
+        for start in range(0, len(file_ids), 500):
+            chunk = file_ids[start : start + 500]
+            with self.lock:
+                rows = self.conn.execute(
+                    f"""SELECT * FROM drive_file
+                        WHERE id IN ({", ".join("?" * len(chunk))})""",
+                    chunk,
+                ).fetchall()
+            found.update({row["id"]: dict(row) for row in rows})
+        return found
+
+    def put(self, files: list[dict]):
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    """REPLACE INTO drive_file
+                        (id, size, md5Checksum, modifiedTime)
+                        VALUES (?, ?, ?, ?)""",
+                    [
+                        (
+                            file["id"],
+                            int(file["size"]) if "size" in file else None,
+                            file.get("md5Checksum"),
+                            file.get("modifiedTime"),
+                        )
+                        for file in files
+                    ],
+                )
+
+    def _watermark(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM drive_sync WHERE name = 'modifiedTime'"
+            ).fetchone()
+        return row["value"] if row is not None else None
+
+    def _set_watermark(self, modified_time: str):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    """REPLACE INTO drive_sync (name, value)
+                        VALUES ('modifiedTime', ?)""",
+                    (modified_time,),
+                )
+
+    def sync(self, service, full=False, num_retries=5) -> int:
+        """Page through files.list and store every file changed since the
+        last sync, or every file with ``full``. Returns the files stored.
+        """
+        query = "trashed = false and mimeType != 'application/vnd.google-apps.folder'"
+        watermark = None if full else self._watermark()
+        if watermark is not None:
+            # RFC 3339 timestamps of Drive compare correctly as strings
+            query += f" and modifiedTime >= '{watermark}'"
+
+        request = service.files().list(
+            q=query,
+            fields=f"nextPageToken, files({METADATA_FIELDS})",
+            pageSize=DRIVE_INDEX_PAGE_SIZE,
+            includeItemsFromAllDrives=True,
+            supportsAllDrives=True,
+        )
+        count = 0
+        latest = watermark
+        while request is not None:
+            response = request.execute(num_retries=num_retries)
+            files = response.get("files", [])
+            self.put(files)
+            count += len(files)
+            latest = max(
+                [latest or ""] + [file["modifiedTime"] for file in files]
+            )
+            request = service.files().list_next(request, response)
+
+        # only listed files move the watermark, single lookups may be newer
+        if latest:
+            self._set_watermark(latest)
+        logging.info(f"Drive index synced {count} files")
+        return count
+
+    def lookup(self, service, file_ids) -> dict:
+        """Return the metadata of file_ids, fetching the ones missing from
+        the index with batch requests. Files that fail are left out.
+        """
+        found = self.get_many(file_ids)
+        missing = [file_id for file_id in file_ids if file_id not in found]
+        fetched = []
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                logging.warning(f"Drive lookup of {request_id}: {exception}")
+            else:
+                fetched.append(response)
+
+        for start in range(0, len(missing), DRIVE_INDEX_BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=collect)
+            for file_id in missing[start : start + DRIVE_INDEX_BATCH_SIZE]:
+                batch.add(
+                    service.files().get(
+                        fileId=file_id,
+                        fields=METADATA_FIELDS,
+                        supportsAllDrives=True,
+                    ),
+                    request_id=file_id,
+                )
+            batch.execute()
+
+        self.put(fetched)
+        found.update({file["id"]: file for file in fetched})
+        return found
+
+    def start_sync(self, downloader_pool, interval=DRIVE_INDEX_SYNC_SECONDS):
+        """Resync in a background thread every interval seconds"""
+        with self.lock:
+            if self.sync_thread is not None:
+                return
+            self.sync_thread = threading.Thread(
+                target=self._run_sync,
+                args=(downloader_pool, interval),
+                name="drive-index-sync",
+                daemon=True,
+            )
+        self.sync_thread.start()
+
+    def _run_sync(self, downloader_pool, interval):
+        while True:
+            try:
+                with downloader_pool.acquire() as downloader:
+                    self.sync(downloader.service)
+            except Exception:
+                logging.exception("Drive index sync failed")
+            time.sleep(interval)
+
+
+_drive_index = None
+_drive_index_lock = threading.Lock()
+
+
+def get_drive_index() -> DriveIndex:
+    global _drive_index
+    with _drive_index_lock:
+        if _drive_index is None:
+            _drive_index = DriveIndex()
+    return _drive_index
+
+
+def main():
+    from src.gdrive import get_downloader_pool
+
+    parser = argparse.ArgumentParser(
+        description="Sync the local index of Google Drive file metadata"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="list every file instead of the ones changed since the last sync",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with get_downloader_pool().acquire() as downloader:
+        get_drive_index().sync(downloader.service, full=args.full)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,22 @@
-import io
-import shutil
+import json
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
+
+from src.drive_index import get_drive_index
 
 SCOPES = ["https://www.googleapis.com/auth/drive"]
+GDRIVE_CHUNK_SIZE = int(os.getenv("GDRIVE_CHUNK_SIZE", str(8 * 1024**2)))
+GDRIVE_NUM_RETRIES = int(os.getenv("GDRIVE_NUM_RETRIES", "5"))
+GDRIVE_POOL_SIZE = int(os.getenv("GDRIVE_POOL_SIZE", "4"))
 
 
 class GDriveCredential:
@@ -37,6 +44,16 @@ class GDriveCredential:
 
         return credentials
 
+    def ensure_valid(self):
+        if (
+            not self.credentials.valid
+            and self.credentials.expired
+            and self.credentials.refresh_token
+        ):
+            self._refresh_credentials(self.credentials)
+            self._save_credentials(self.credentials, "token.json")
+        return self.credentials
+
     def _parse_credentials(self, filename="token.json"):
         return Credentials.from_authorized_user_file(filename, self.scopes)
 
@@ -63,13 +80,134 @@ class GDriveDownloader:
     def get_service(self):
         return build("drive", "v3", credentials=self.credentials)
 
-    def download(self, file_id, download_path, file_name):
-        request = self.service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-            fh.seek(0)
-            with open(Path(download_path, file_name), "wb") as f:
-                shutil.copyfileobj(fh, f)
+    def get_metadata(self, file_id, fresh=True):
+        # always read from Drive, fresh is for the pool's signature
+        return (
+            self.service.files()
+            .get(fileId=file_id, fields="id, size, md5Checksum, modifiedTime")
+            .execute()
+        )
+
+    def download(
+        self,
+        file_id,
+        download_path,
+        file_name,
+        chunk_size=GDRIVE_CHUNK_SIZE,
+        metadata=None,
+    ):
+        """Stream the file to disk with one HTTP Range request per chunk.
+
+        Chunks are appended to ``<file_name>.part`` which is renamed once the
+        download completes, so a download interrupted by a dropped connection
+        resumes from the partial file. The version of the file being
+        downloaded is kept in ``<file_name>.part.json``, and a partial file
+        of another version is discarded instead of resumed.
+        """
+        if metadata is None:
+            metadata = self.get_metadata(file_id)
+        target_path = Path(download_path, file_name)
+        part_path = Path(download_path, f"{file_name}.part")
+        version_path = Path(download_path, f"{file_name}.part.json")
+        version = {
+            "md5Checksum": metadata.get("md5Checksum"),
+            "modifiedTime": metadata.get("modifiedTime"),
+        }
+        size = int(metadata["size"]) if "size" in metadata else None
+
+        if part_path.exists():
+            try:
+                with open(version_path) as f:
+                    part_version = json.load(f)
+            except (OSError, ValueError):
+                part_version = None
+            # without a size the length of the partial file is unknown too
+            if (
+                (part_version != version)
+                or (size is None)
+                or (part_path.stat().st_size > size)
+            ):
+                logging.info(f"Discard partial download of {file_id}")
+                part_path.unlink()
+        with open(version_path, "w") as f:
+            json.dump(version, f)
+
+        with open(part_path, "ab") as f:
+            offset = f.tell()
+            if offset:
+                logging.info(f"Resume download {file_id} from {offset} bytes")
+            while (size is None) or (offset < size):
+                request = self.service.files().get_media(fileId=file_id)
+                if size is not None:
+                    end = offset + chunk_size - 1
+                    request.headers["Range"] = f"bytes={offset}-{end}"
+                content = request.execute(num_retries=GDRIVE_NUM_RETRIES)
+                f.write(content)
+                offset += len(content)
+                if (size is None) or (not content):
+                    break
+        if (size is not None) and (offset != size):
+            raise ConnectionError(
+                f"Download of {file_id} stopped at {offset} of {size} bytes"
+            )
+
+        os.replace(part_path, target_path)
+        version_path.unlink(missing_ok=True)
+
+
+class GDriveDownloaderPool:
+    """Process-wide pool of Drive downloaders shared by sessions and reruns.
+
+    httplib2 is not thread-safe, so a downloader is lent to one thread at a
+    time. Credentials are loaded once and refreshed under a lock. The pool
+    exposes the same ``download``/``get_metadata`` methods as a downloader;
+    metadata is read from the local Drive index when it has the file,
+    unless ``fresh`` asks Drive for the current version.
+    """
+
+    def __init__(self, credential: GDriveCredential, size=GDRIVE_POOL_SIZE):
+        self.credential = credential
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    @contextmanager
+    def acquire(self):
+        with self.slots:
+            with self.lock:
+                credentials = self.credential.ensure_valid()
+            try:
+                downloader = self.idle.get_nowait()
+            except queue.Empty:
+                logging.info("Build a new Drive service")
+                downloader = GDriveDownloader(credentials)
+            try:
+                yield downloader
+            finally:
+                self.idle.put(downloader)
+
+    def get_metadata(self, file_id, fresh=False):
+        metadata = None if fresh else get_drive_index().get(file_id)
+        if metadata is None:
+            with self.acquire() as downloader:
+                metadata = downloader.get_metadata(file_id)
+            get_drive_index().put([metadata])
+        return metadata
+
+    def download(self, file_id, download_path, file_name, **kwargs):
+        with self.acquire() as downloader:
+            return downloader.download(
+                file_id, download_path, file_name, **kwargs
+            )
+
+
+_downloader_pool = None
+_downloader_pool_lock = threading.Lock()
+
+
+def get_downloader_pool() -> GDriveDownloaderPool:
+    global _downloader_pool
+    with _downloader_pool_lock:
+        if _downloader_pool is None:
+            _downloader_pool = GDriveDownloaderPool(GDriveCredential())
+    return _downloader_pool
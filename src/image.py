@@ -10,7 +10,10 @@ import streamlit as st
 import tifffile
 from PIL import Image
 
-from src.database import query_database
+from src.database import cached_query_database, query_database
+from src.normalize import normalize_to_uint8
+from src.session import get_workspace
+from src.volume import ChunkedVolume, HTVolume
 
 
 class ImageType(Enum):
@@ -69,7 +72,8 @@ class CellImageMeta:
         if (cell_type is None) | (cell_number is None):
             return []
 
-        data = query_database(
+        data = cached_query_database(
+            project_name,
             f"""SELECT i.image_id, i.google_drive_file_id, i.image_type, c.cell_type, c.cell_number, c.cell_id, c.patient_id, q.quality
                 FROM (SELECT *
                     FROM {project_name}_cell 
@@ -79,7 +83,7 @@ class CellImageMeta:
                 LEFT JOIN {project_name}_image i
                 ON i.cell_id = c.cell_id
                 LEFT JOIN {project_name}_image_quality q
-                ON i.image_id = q.image_id"""
+                ON i.image_id = q.image_id""",
         )
         return [
             CellImageMeta(
@@ -100,18 +104,12 @@ class TomocubeImage:
     def __init__(self, image_path: Path):
         self.image_path = image_path
 
-    def process(self):
-        image_arr = self.read_image()
-        image_arr = self.normalize_img(image_arr)
-        return image_arr.astype(np.uint8)
+    def process(self, percentiles=None):
+        return normalize_to_uint8(self.read_image(), percentiles=percentiles)
 
     def read_image(self) -> np.ndarray:
         return tifffile.imread(str(self.image_path))
 
-    @staticmethod
-    def normalize_img(img: np.ndarray) -> np.ndarray:
-        return (img - np.min(img)) / (np.max(img) - np.min(img)) * 255
-
     @staticmethod
     def numpy_to_image(img_arr: np.ndarray) -> Image.Image:
         return Image.fromarray(img_arr)
@@ -142,6 +140,13 @@ class BFImage(TomocubeImage):
         return image_arr.astype(np.uint8)
 
 
+class HTImage(TomocubeImage):
+    def process(self):
+        if not HTVolume.is_supported(self.image_path):
+            return super().process()
+        return ChunkedVolume.from_tiff(self.image_path)
+
+
 def find_cell_image_by_image_type(
     cell_images: list[CellImageMeta], image_type: ImageType
 ) -> Union[CellImageMeta, None]:
@@ -171,13 +176,19 @@ def get_images(
     return bf, mip, ht
 
 
-def download_image(
-    downloader, google_file_id, download_path, download_filename, key
-):
-    downloader.download(google_file_id, download_path, download_filename)
-    image_path = Path(download_path, download_filename)
+def load_image(image_path: Path, key: str) -> Union[np.ndarray, ChunkedVolume]:
     if key == "bf_image":
-        st.session_state[key] = BFImage(image_path).process()
-    elif (key == "mip_image") | (key == 'ht_image'):
-        st.session_state[key] = TomocubeImage(image_path).process()
-    
\ No newline at end of file
+        return BFImage(image_path).process()
+    elif key == "mip_image":
+        return TomocubeImage(image_path).process()
+    elif key == "ht_image":
+        return HTImage(image_path).process()
+
+
+def download_image(storage, google_file_id, key, prefetcher=None):
+    # the session holds the file so no other session's download evicts it
+    get_workspace().hold(key, google_file_id)
+    image = prefetcher.take(google_file_id) if prefetcher is not None else None
+    if image is None:
+        image = load_image(storage.fetch(google_file_id), key)
+    st.session_state[key] = image
@@ -0,0 +1,474 @@
+import fcntl
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from urllib.parse import quote
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image/cache")
+IMAGE_CACHE_MAX_BYTES = int(
+    os.getenv("IMAGE_CACHE_MAX_BYTES", str(20 * 1024**3))
+)
+# cache hits update last_access in one batch at most this often
+IMAGE_CACHE_TOUCH_SECONDS = float(os.getenv("IMAGE_CACHE_TOUCH_SECONDS", "30"))
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def md5sum(path: Path, chunk_size=8 * 1024**2) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class ImageCache:
+    """Disk cache of Google Drive files keyed by file id.
+
+    An entry is reused only while its md5Checksum and modifiedTime still
+    match the Drive metadata. The least recently used entries are evicted
+    once the cache grows beyond ``max_bytes``, except files that a session
+    still holds through its ``Workspace``. A held entry keeps a shared
+    flock on ``.locks/<name>.hold``, so eviction by any process sharing the
+    directory skips it.
+
+    The index is a SQLite WAL table in the cache directory, shared by every
+    process using the directory: a file ``predownload.py`` fetches is a hit
+    for a running app, and counts against ``max_bytes`` for both.
+
+    Directories derived from cached files, such as chunked HT volumes, are
+    entries too. ``<file_id>.<suffix>`` next to a file goes with the file
+    when it is evicted, and copies derived from files outside the cache
+    live in ``local/`` on their own.
+    """
+
+    index_filename = "index.sqlite"
+    legacy_index_filename = "index.json"
+    lock_dirname = ".locks"
+    local_dirname = "local"
+
+    def __init__(
+        self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.file_locks = defaultdict(threading.Lock)
+        self.refs = Counter()
+        self.holds = {}
+        self.touched = {}
+        self.touched_flushed_at = time.monotonic()
+        Path(self.cache_dir, self.lock_dirname).mkdir(
+            parents=True, exist_ok=True
+        )
+        self.conn = sqlite3.connect(
+            str(Path(self.cache_dir, self.index_filename)),
+            check_same_thread=False,
+            timeout=30,
+        )
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        # the index can be rebuilt from the files, so skip fsync per write
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        with self.conn:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache_entry (
+                    file_id TEXT PRIMARY KEY,
+                    parent TEXT,
+                    md5Checksum TEXT,
+                    modifiedTime TEXT,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self.conn.execute(
+                """CREATE INDEX IF NOT EXISTS cache_entry_last_access
+                    ON cache_entry (last_access)"""
+            )
+        self._adopt_untracked()
+
+    def _load_legacy_index(self) -> dict:
+        index_path = Path(self.cache_dir, self.legacy_index_filename)
+        if not index_path.exists():
+            return {}
+        try:
+            with open(index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logging.warning(f"Discard broken image cache index {index_path}")
+            return {}
+
+    def _adopt_untracked(self):
+        """Index cached files no process recorded, such as entries of the
+        former JSON index or a download interrupted before ``store``, so
+        they count against max_bytes and can be evicted. Their checksum is
+        unknown unless the JSON index had it, and is verified on lookup.
+        """
+        legacy = self._load_legacy_index()
+        with self.lock:
+            known = {
+                row["file_id"]
+                for row in self.conn.execute("SELECT file_id FROM cache_entry")
+            }
+            entries = []
+            for path in self.cache_dir.iterdir():
+                # Drive ids have no dots, unlike .part files and the index
+                if (
+                    (not path.is_file())
+                    | ("." in path.name)
+                    | (path.name in known)
+                ):
+                    continue
+                stat = path.stat()
+                entry = legacy.get(path.name, {})
+                entries.append(
+                    (
+                        path.name,
+                        entry.get("md5Checksum"),
+                        entry.get("modifiedTime"),
+                        stat.st_size,
+                        entry.get("last_access", stat.st_mtime),
+                    )
+                )
+            with self.conn:
+                self.conn.executemany(
+                    """INSERT OR IGNORE INTO cache_entry
+                        (file_id, md5Checksum, modifiedTime, size, last_access)
+                        VALUES (?, ?, ?, ?, ?)""",
+                    entries,
+                )
+                self.conn.executemany(
+                    """INSERT OR IGNORE INTO cache_entry
+                        (file_id, parent, size, last_access)
+                        VALUES (?, ?, ?, ?)""",
+                    [
+                        (
+                            self.entry_name(path),
+                            self.parent_of(self.entry_name(path)),
+                            dir_size(path),
+                            path.stat().st_mtime,
+                        )
+                        for path in itertools.chain(
+                            self.cache_dir.glob("*.chunks"),
+                            self.cache_dir.glob(
+                                f"{self.local_dirname}/*.chunks"
+                            ),
+                        )
+                        if self.entry_name(path) not in known
+                    ],
+                )
+        Path(self.cache_dir, self.legacy_index_filename).unlink(
+            missing_ok=True
+        )
+
+    def path(self, file_id: str) -> Path:
+        return Path(self.cache_dir, file_id)
+
+    def entry_name(self, path: Path) -> str:
+        return (
+            Path(path)
+            .resolve()
+            .relative_to(self.cache_dir.resolve())
+            .as_posix()
+        )
+
+    @staticmethod
+    def parent_of(name: str):
+        """The cached file an entry such as <file_id>.chunks derives from"""
+        return name.split(".")[0] if "." in name and "/" not in name else None
+
+    def _get_entry(self, file_id: str):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM cache_entry WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def lookup(self, file_id: str, metadata: dict):
+        path = self.path(file_id)
+        if not path.exists():
+            return None
+        entry = self._get_entry(file_id)
+        if (entry is None) or (entry["md5Checksum"] is None):
+            # a file on disk the index does not vouch for is checked once
+            if (metadata.get("md5Checksum") is None) or (
+                md5sum(path) != metadata["md5Checksum"]
+            ):
+                return None
+            return self.store(file_id, metadata)
+        if (entry["md5Checksum"] != metadata.get("md5Checksum")) | (
+            entry["modifiedTime"] != metadata.get("modifiedTime")
+        ):
+            return None
+        self.touch(file_id)
+        return path
+
+    def touch(self, file_id: str):
+        with self.lock:
+            self.touched[file_id] = time.time()
+            if (
+                time.monotonic() - self.touched_flushed_at
+                >= IMAGE_CACHE_TOUCH_SECONDS
+            ):
+                self._flush_touched()
+
+    def _flush_touched(self):
+        with self.lock:
+            touched, self.touched = self.touched, {}
+            self.touched_flushed_at = time.monotonic()
+            if not touched:
+                return
+            with self.conn:
+                self.conn.executemany(
+                    """UPDATE cache_entry
+                        SET last_access = MAX(last_access, ?)
+                        WHERE file_id = ?""",
+                    [
+                        (last_access, file_id)
+                        for file_id, last_access in touched.items()
+                    ],
+                )
+
+    def store(self, file_id: str, metadata: dict):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    """REPLACE INTO cache_entry
+                        (file_id, md5Checksum, modifiedTime, size, last_access)
+                        VALUES (?, ?, ?, ?, ?)""",
+                    (
+                        file_id,
+                        metadata.get("md5Checksum"),
+                        metadata.get("modifiedTime"),
+                        self.path(file_id).stat().st_size,
+                        time.time(),
+                    ),
+                )
+            self.evict(keep=file_id)
+            return self.path(file_id)
+
+    def store_derived(self, path: Path):
+        """Index a directory derived from a cached or local file"""
+        name = self.entry_name(path)
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    """REPLACE INTO cache_entry
+                        (file_id, parent, size, last_access)
+                        VALUES (?, ?, ?, ?)""",
+                    (name, self.parent_of(name), dir_size(path), time.time()),
+                )
+            self.evict(keep=name)
+
+    def evict(self, keep=None):
+        with self.lock:
+            # the LRU order needs the pending hits
+            self._flush_touched()
+            total_size = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache_entry"
+            ).fetchone()[0]
+            if total_size <= self.max_bytes:
+                return
+            rows = self.conn.execute(
+                """SELECT file_id, parent, size FROM cache_entry
+                    ORDER BY last_access"""
+            ).fetchall()
+            derived = defaultdict(list)
+            for row in rows:
+                if row["parent"] is not None:
+                    derived[row["parent"]].append(row)
+
+            evicted = set()
+            for row in rows:
+                if total_size <= self.max_bytes:
+                    break
+                if (row["file_id"] in evicted) | self._in_use(row, keep):
+                    continue
+                # converted copies such as <file_id>.chunks go with the file
+                for entry in [row] + derived[row["file_id"]]:
+                    if (entry["file_id"] in evicted) | self._in_use(
+                        entry, keep
+                    ):
+                        continue
+                    with self._unheld(entry) as unheld:
+                        # held by a session of another process
+                        if not unheld:
+                            continue
+                        path = self.path(entry["file_id"])
+                        if path.is_dir():
+                            shutil.rmtree(path, ignore_errors=True)
+                        else:
+                            path.unlink(missing_ok=True)
+                    evicted.add(entry["file_id"])
+                    total_size -= entry["size"]
+            with self.conn:
+                self.conn.executemany(
+                    "DELETE FROM cache_entry WHERE file_id = ?",
+                    [(file_id,) for file_id in evicted],
+                )
+
+    def hold_path(self, name: str) -> Path:
+        # names of derived entries such as local/<digest>.chunks have slashes
+        return Path(
+            self.cache_dir, self.lock_dirname, f"{quote(name, safe='')}.hold"
+        )
+
+    @contextmanager
+    def _unheld(self, entry):
+        """Yield whether no process holds the entry or the file it derives
+        from, keeping both from being held until the entry is removed"""
+        with ExitStack() as stack:
+            for name in (entry["file_id"], entry["parent"]):
+                if name is None:
+                    continue
+                f = stack.enter_context(open(self.hold_path(name), "a"))
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+                stack.callback(fcntl.flock, f, fcntl.LOCK_UN)
+            yield True
+
+    def _in_use(self, entry, keep) -> bool:
+        names = [entry["file_id"], entry["parent"]]
+        return any(
+            (name is not None) and ((name == keep) | (self.refs[name] > 0))
+            for name in names
+        )
+
+    @contextmanager
+    def file_lock(self, name: str):
+        """Exclusive use of a cache entry by one thread of one process.
+
+        The thread lock orders the threads of this process, and an flock on
+        ``.locks/<name>.lock`` orders the processes sharing the directory,
+        such as the app and ``predownload.py``.
+        """
+        with self.lock:
+            thread_lock = self.file_locks[name]
+        with thread_lock:
+            lock_path = Path(self.cache_dir, self.lock_dirname, f"{name}.lock")
+            with open(lock_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, file_id: str):
+        with self.lock:
+            self.refs[file_id] += 1
+            if file_id not in self.holds:
+                f = open(self.hold_path(file_id), "a")
+                # waits only while another process removes the entry
+                fcntl.flock(f, fcntl.LOCK_SH)
+                self.holds[file_id] = f
+
+    def release(self, file_id: str):
+        with self.lock:
+            self.refs[file_id] -= 1
+            if self.refs[file_id] <= 0:
+                del self.refs[file_id]
+                f = self.holds.pop(file_id, None)
+                if f is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                    f.close()
+
+    def fetch(
+        self, downloader, file_id: str, metadata=None, verify=False
+    ) -> Path:
+        """Return a local path of the Drive file, downloading it if needed.
+
+        With ``verify`` a fresh download is checked against the Drive
+        md5Checksum and discarded with a ValueError if it does not match.
+        """
+        if metadata is None:
+            metadata = downloader.get_metadata(file_id)
+
+        # Concurrent fetches of one file, from any process, wait for a
+        # single download into its .part file
+        with self.file_lock(file_id):
+            cached_path = self.lookup(file_id, metadata)
+            if cached_path is not None:
+                logging.info(f"Image cache hit: {file_id}")
+                return cached_path
+
+            # the metadata may come from an index synced minutes ago, so
+            # download and record the version Drive has now
+            metadata = downloader.get_metadata(file_id, fresh=True)
+            cached_path = self.lookup(file_id, metadata)
+            if cached_path is not None:
+                logging.info(f"Image cache hit: {file_id}")
+                return cached_path
+
+            logging.info(f"Image cache miss: {file_id}")
+            downloader.download(
+                file_id, self.cache_dir, file_id, metadata=metadata
+            )
+            if verify and (metadata.get("md5Checksum") is not None):
+                checksum = md5sum(self.path(file_id))
+                if checksum != metadata["md5Checksum"]:
+                    self.path(file_id).unlink(missing_ok=True)
+                    raise ValueError(
+                        f"md5 mismatch of {file_id}: {checksum} != {metadata['md5Checksum']}"
+                    )
+            return self.store(file_id, metadata)
+
+
+image_cache = ImageCache()
+
+
+def _release_all(cache: ImageCache, held: dict, lock: threading.Lock):
+    with lock:
+        for file_id in held.values():
+            cache.release(file_id)
+        held.clear()
+
+
+class Workspace:
+    """Cached files in use by one session, keyed by slot such as "ht_image".
+
+    Holding a file keeps it out of cache eviction. Files are shared with
+    every other session, and a session that ends releases what it held
+    when its workspace is garbage collected.
+    """
+
+    def __init__(self, cache: ImageCache = image_cache):
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.held = {}
+        # the finalizer must not reference self, only its state
+        self._finalizer = weakref.finalize(
+            self, _release_all, cache, self.held, self.lock
+        )
+
+    def hold(self, key, file_id: str):
+        """Hold file_id in slot key, releasing what the slot held before"""
+        self.cache.acquire(file_id)
+        with self.lock:
+            previous = self.held.get(key)
+            self.held[key] = file_id
+        if previous is not None:
+            self.cache.release(previous)
+
+    def release(self, key):
+        with self.lock:
+            file_id = self.held.pop(key, None)
+        if file_id is not None:
+            self.cache.release(file_id)
+
+    def close(self):
+        self._finalizer()
@@ -0,0 +1,204 @@
+"""Check the MySQL tables of each project against the indexes the app needs.
+
+For every project the advisor reads the existing indexes from
+information_schema, runs EXPLAIN on the query shapes of the labeller pages
+and reports full table scans, then creates the missing indexes of
+``PROJECT_INDEXES`` after confirmation. Indexes already covered by the
+leftmost columns of an existing index are skipped, so the command can be
+rerun, e.g. right after a new project is imported:
+
+    python -m src.index_advisor [project_name ...] [--yes]
+"""
+import argparse
+import logging
+from collections import defaultdict
+
+from src.database import is_sqlite, list_tables, query_database
+from src.pending_index import LABEL_TYPES
+from src.schema import PROJECT_INDEXES, Index
+
+
+def query_shapes(project_name: str) -> dict:
+    """The hot queries of the app with placeholder values"""
+    label_joins = " ".join(
+        f"""LEFT JOIN {project_name}_image_{label_type} {label_type}
+            ON i.image_id = {label_type}.image_id"""
+        for label_type in LABEL_TYPES
+    )
+    return {
+        "cell images": f"""SELECT i.image_id, i.google_drive_file_id, i.image_type, q.quality
+            FROM {project_name}_cell c
+            LEFT JOIN {project_name}_image i
+            ON i.cell_id = c.cell_id
+            LEFT JOIN {project_name}_image_quality q
+            ON i.image_id = q.image_id
+            WHERE c.cell_type = '' AND c.cell_number = 0 AND c.patient_id = 0""",
+        "cell index": f"""SELECT p.patient_id, c.cell_type, c.cell_number
+            FROM {project_name}_patient p
+            LEFT JOIN {project_name}_cell c
+            ON c.patient_id = p.patient_id
+            ORDER BY p.patient_id, c.cell_type, c.cell_number""",
+        "cell metadata table": f"""SELECT p.project_id, c.patient_id, c.cell_type, i.image_type, q.quality
+            FROM {project_name}_image i
+            LEFT JOIN {project_name}_patient p
+            ON p.patient_id = i.patient_id
+            LEFT JOIN {project_name}_cell c
+            ON i.cell_id = c.cell_id
+            LEFT JOIN {project_name}_image_quality q
+            ON i.image_id = q.image_id""",
+        "pending index": f"""SELECT i.image_id, c.cell_id
+            FROM {project_name}_image i
+            JOIN {project_name}_cell c
+            ON i.cell_id = c.cell_id
+            {label_joins}
+            WHERE i.image_type = 'HOLOTOMOGRAPHY'""",
+    }
+
+
+def get_table_columns(project_name: str) -> dict:
+    columns = defaultdict(set)
+    for data in query_database(
+        """SELECT TABLE_NAME, COLUMN_NAME
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME LIKE %s""",
+        (f"{project_name}\\_%",),
+    ):
+        columns[data["TABLE_NAME"]].add(data["COLUMN_NAME"])
+    return columns
+
+
+def get_existing_indexes(project_name: str) -> dict:
+    """Map each table to {index name: columns in index order}"""
+    indexes = defaultdict(dict)
+    for data in query_database(
+        """SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME LIKE %s
+        ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX""",
+        (f"{project_name}\\_%",),
+    ):
+        indexes[data["TABLE_NAME"]].setdefault(data["INDEX_NAME"], ())
+        indexes[data["TABLE_NAME"]][data["INDEX_NAME"]] += (
+            data["COLUMN_NAME"],
+        )
+    return indexes
+
+
+def find_missing_indexes(project_name: str) -> list[Index]:
+    columns = get_table_columns(project_name)
+    existing = get_existing_indexes(project_name)
+    missing = []
+    for index in PROJECT_INDEXES:
+        table_name = index.table_name(project_name)
+        if not set(index.columns) <= columns.get(table_name, set()):
+            logging.warning(
+                f"Skip {index.name} of {table_name}: table or columns missing"
+            )
+            continue
+        table_indexes = existing.get(table_name, {})
+        # an index also serves any leftmost prefix of its columns
+        if any(
+            existing_columns[: len(index.columns)] == index.columns
+            for existing_columns in table_indexes.values()
+        ):
+            continue
+        if index.name in table_indexes:
+            logging.warning(
+                f"{table_name} has an index {index.name} on other columns"
+            )
+            continue
+        missing.append(index)
+    return missing
+
+
+def find_full_scans(project_name: str) -> list[dict]:
+    """EXPLAIN rows of the query shapes that read a whole table"""
+    full_scans = []
+    for shape, sql in query_shapes(project_name).items():
+        try:
+            plan = query_database(f"EXPLAIN {sql}")
+        except Exception as error:
+            logging.warning(
+                f"Cannot EXPLAIN {shape} of {project_name}: {error}"
+            )
+            continue
+        full_scans += [
+            {"shape": shape, "table": row["table"], "rows": row["rows"]}
+            for row in plan
+            if row["type"] == "ALL"
+        ]
+    return full_scans
+
+
+def create_index(project_name: str, index: Index):
+    unique = "UNIQUE " if index.unique else ""
+    query_database(
+        f"""ALTER TABLE {index.table_name(project_name)}
+            ADD {unique}INDEX {index.name} ({", ".join(index.columns)})"""
+    )
+
+
+def advise(project_name: str) -> list[Index]:
+    """Log the full scans and missing indexes of a project"""
+    for full_scan in find_full_scans(project_name):
+        logging.info(
+            f"{project_name} {full_scan['shape']}: full scan of "
+            f"{full_scan['table']} ({full_scan['rows']} rows)"
+        )
+    missing = find_missing_indexes(project_name)
+    for index in missing:
+        logging.info(
+            f"{project_name}: missing index {index.name} on "
+            f"{index.table_name(project_name)} ({', '.join(index.columns)})"
+        )
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report full scans and create missing indexes of tomocube projects"
+    )
+    parser.add_argument(
+        "project_name", nargs="*", help="all projects if omitted"
+    )
+    parser.add_argument(
+        "--yes", action="store_true", help="create indexes without asking"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if is_sqlite():
+        raise SystemExit(
+            "SQLite project tables are created with their indexes"
+        )
+    project_names = args.project_name or [
+        table_name.replace("_patient", "")
+        for table_name in list_tables("%patient")
+    ]
+    missing = [
+        (project_name, index)
+        for project_name in project_names
+        for index in advise(project_name)
+    ]
+    if not missing:
+        logging.info("No missing indexes")
+        return
+    if not args.yes:
+        answer = input(f"Create {len(missing)} indexes? [y/N] ")
+        if answer.strip().lower() != "y":
+            return
+    for project_name, index in missing:
+        logging.info(
+            f"Create {index.name} on {index.table_name(project_name)}"
+        )
+        try:
+            create_index(project_name, index)
+        except Exception:
+            # e.g. duplicate image_id rows block a unique index
+            logging.exception(f"Failed to create {index.name}")
+
+
+if __name__ == "__main__":
+    main()
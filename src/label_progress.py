@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+from src.database import (
+    Database,
+    cached_query_database,
+    query_cache,
+    query_database,
+)
+
+LABEL_PROGRESS_RECONCILE_SECONDS = float(
+    os.getenv("LABEL_PROGRESS_RECONCILE_SECONDS", "3600")
+)
+
+_table_ready = threading.Event()
+
+
+def ensure_progress_table():
+    if _table_ready.is_set():
+        return
+    query_database(
+        """CREATE TABLE IF NOT EXISTS label_progress (
+            project_name VARCHAR(255) NOT NULL,
+            label_type VARCHAR(32) NOT NULL,
+            total_cell_count INT NOT NULL,
+            labelled_cell_count INT NOT NULL,
+            reconciled_at DOUBLE NOT NULL,
+            PRIMARY KEY (project_name, label_type)
+        )"""
+    )
+    _table_ready.set()
+
+
+def reconcile_progress(project_name: str, label_type: str) -> dict:
+    """Recount the cells of a project and store them in label_progress"""
+    ensure_progress_table()
+    total_cell_count = query_database(
+        f"SELECT COUNT(*) AS cell_count FROM {project_name}_cell"
+    )[0].get("cell_count")
+    labelled_cell_count = query_database(
+        f"""SELECT count(distinct(i.cell_id)) as cell_count
+            FROM {project_name}_image_{label_type} q
+            LEFT JOIN {project_name}_image i
+            ON q.image_id = i.image_id"""
+    )[0].get("cell_count")
+    progress = {
+        "project_name": project_name,
+        "label_type": label_type,
+        "total_cell_count": total_cell_count,
+        "labelled_cell_count": labelled_cell_count,
+        "reconciled_at": time.time(),
+    }
+    query_database(
+        """REPLACE INTO label_progress
+            (project_name, label_type, total_cell_count, labelled_cell_count, reconciled_at)
+            VALUES (%(project_name)s, %(label_type)s, %(total_cell_count)s, %(labelled_cell_count)s, %(reconciled_at)s)""",
+        progress,
+    )
+    query_cache.invalidate(project_name)
+    return progress
+
+
+def _is_stale(progress: dict) -> bool:
+    return (
+        time.time() - progress["reconciled_at"]
+        > LABEL_PROGRESS_RECONCILE_SECONDS
+    )
+
+
+def get_progress(project_name: str, label_type: str) -> dict:
+    ensure_progress_table()
+    data = cached_query_database(
+        project_name,
+        """SELECT * FROM label_progress
+            WHERE project_name = %s AND label_type = %s""",
+        (project_name, label_type),
+    )
+    if (len(data) == 0) or _is_stale(data[0]):
+        return reconcile_progress(project_name, label_type)
+    return data[0]
+
+
+def get_all_progress(project_names, label_types) -> list[dict]:
+    """Read the progress of every project with one query"""
+    ensure_progress_table()
+    data = {
+        (progress["project_name"], progress["label_type"]): progress
+        for progress in query_database("SELECT * FROM label_progress")
+    }
+    all_progress = []
+    for project_name in project_names:
+        for label_type in label_types:
+            progress = data.get((project_name, label_type))
+            if (progress is None) or _is_stale(progress):
+                progress = reconcile_progress(project_name, label_type)
+            all_progress.append(progress)
+    return all_progress
+
+
+def count_unlabelled_cells(
+    database: Database, project_name, label_type, image_ids
+) -> int:
+    """Count the cells of the images that have no label of this type yet.
+
+    Call it in the write transaction before the labels are inserted.
+    """
+    return database.execute_sql(
+        f"""SELECT count(distinct(i.cell_id)) AS cell_count
+            FROM {project_name}_image i
+            WHERE i.image_id IN %s
+            AND NOT EXISTS (
+                SELECT 1
+                FROM {project_name}_image li
+                JOIN {project_name}_image_{label_type} l
+                ON l.image_id = li.image_id
+                WHERE li.cell_id = i.cell_id)""",
+        (tuple(image_ids),),
+    )[0].get("cell_count")
+
+
+def count_queued_labelled_cells(project_name, label_type, image_ids) -> int:
+    """Count the cells that queued labels of image_ids will add to the
+    progress, i.e. the ones without a label in the database yet
+    """
+    if not image_ids:
+        return 0
+    with Database() as database:
+        return count_unlabelled_cells(
+            database, project_name, label_type, tuple(image_ids)
+        )
+
+
+def add_labelled_cells(
+    database: Database, project_name, label_type, cell_count: int
+):
+    if cell_count == 0:
+        return
+    database.execute_sql(
+        """UPDATE label_progress
+            SET labelled_cell_count = labelled_cell_count + %s
+            WHERE project_name = %s AND label_type = %s""",
+        (cell_count, project_name, label_type),
+    )
@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from src.label_writer import save_labels
+
+LABEL_QUEUE_PATH = os.getenv("LABEL_QUEUE_PATH", "label_queue.sqlite")
+LABEL_QUEUE_BATCH_DELAY = float(os.getenv("LABEL_QUEUE_BATCH_DELAY", "0.5"))
+LABEL_QUEUE_MAX_BACKOFF = float(os.getenv("LABEL_QUEUE_MAX_BACKOFF", "60"))
+
+
+class LabelQueue:
+    """Durable write-behind queue of labels in a local SQLite WAL journal.
+
+    Save callbacks only append to the journal. A background worker writes
+    the queued labels to MySQL in batches per project and label type, where
+    the latest label of an image wins, and retries with backoff while the
+    database is unreachable.
+    """
+
+    def __init__(self, path=LABEL_QUEUE_PATH):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.last_error = None
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = FULL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS label_queue (
+                queue_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_name TEXT NOT NULL,
+                label_type TEXT NOT NULL,
+                image_id INTEGER NOT NULL,
+                label TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self.worker = threading.Thread(
+            target=self._run, name="label-queue", daemon=True
+        )
+        self.worker.start()
+
+    def put(self, project_name: str, label_type: str, labels: list[dict]):
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    """INSERT INTO label_queue
+                        (project_name, label_type, image_id, label, created_at)
+                        VALUES (?, ?, ?, ?, ?)""",
+                    [
+                        (
+                            project_name,
+                            label_type,
+                            label["image_id"],
+                            json.dumps(label),
+                            time.time(),
+                        )
+                        for label in labels
+                    ],
+                )
+        self.wakeup.set()
+
+    def pending_count(self, project_name=None) -> int:
+        with self.lock:
+            return self.conn.execute(
+                """SELECT COUNT(*) FROM label_queue
+                    WHERE ? IS NULL OR project_name = ?""",
+                (project_name, project_name),
+            ).fetchone()[0]
+
+    def queued_image_ids(self, project_name, label_type) -> set:
+        """Images with a label of this type that is not written yet"""
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT DISTINCT image_id FROM label_queue
+                    WHERE project_name = ? AND label_type = ?""",
+                (project_name, label_type),
+            ).fetchall()
+        return {row["image_id"] for row in rows}
+
+    def pending_label(self, project_name, label_type, image_id):
+        """Return the queued label of an image that is not written yet"""
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT label FROM label_queue
+                    WHERE project_name = ? AND label_type = ? AND image_id = ?
+                    ORDER BY queue_id DESC LIMIT 1""",
+                (project_name, label_type, image_id),
+            ).fetchone()
+        return json.loads(row["label"]) if row is not None else None
+
+    def flush(self):
+        """Write every queued label to the database, batch by batch"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM label_queue ORDER BY queue_id"
+            ).fetchall()
+
+        batches = {}
+        for row in rows:
+            batch = batches.setdefault(
+                (row["project_name"], row["label_type"]), ([], {})
+            )
+            batch[0].append(row["queue_id"])
+            batch[1][row["image_id"]] = json.loads(row["label"])
+
+        failed = False
+        for (project_name, label_type), (queue_ids, labels) in batches.items():
+            try:
+                save_labels(project_name, label_type, list(labels.values()))
+            except Exception as error:
+                logging.exception(
+                    f"Failed to write queued {label_type} labels of {project_name}"
+                )
+                self.last_error = repr(error)
+                failed = True
+                continue
+            with self.lock:
+                with self.conn:
+                    self.conn.executemany(
+                        "DELETE FROM label_queue WHERE queue_id = ?",
+                        [(queue_id,) for queue_id in queue_ids],
+                    )
+        if not failed:
+            self.last_error = None
+        return not failed
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            self.wakeup.wait(timeout=backoff if self.last_error else None)
+            # gather the clicks that follow closely into the same batch
+            time.sleep(LABEL_QUEUE_BATCH_DELAY)
+            self.wakeup.clear()
+            if self.flush():
+                backoff = 1.0
+            else:
+                backoff = min(backoff * 2, LABEL_QUEUE_MAX_BACKOFF)
+
+
+_label_queue = None
+_label_queue_lock = threading.Lock()
+
+
+def get_label_queue() -> LabelQueue:
+    global _label_queue
+    with _label_queue_lock:
+        if _label_queue is None:
+            _label_queue = LabelQueue()
+            # labels left over from the previous run are written at start
+            _label_queue.wakeup.set()
+    return _label_queue
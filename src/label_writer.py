@@ -0,0 +1,64 @@
+from src.database import Database, is_sqlite, query_cache
+from src.label_progress import (
+    add_labelled_cells,
+    count_unlabelled_cells,
+    ensure_progress_table,
+)
+from src.pending_index import (
+    ensure_pending_index,
+    pending_index_lock,
+    remove_pending,
+)
+
+LABEL_COLUMNS = {"quality": ("quality",), "center": ("x", "y", "z")}
+
+
+def upsert_label_sql(project_name: str, label_type: str) -> str:
+    columns = ("image_id",) + LABEL_COLUMNS[label_type]
+    placeholders = ", ".join(["%s"] * len(columns))
+    if is_sqlite():
+        updates = ", ".join(
+            f"{column} = excluded.{column}"
+            for column in LABEL_COLUMNS[label_type]
+        )
+        return f"""INSERT INTO {project_name}_image_{label_type} ({", ".join(columns)})
+            VALUES ({placeholders})
+            ON CONFLICT (image_id) DO UPDATE SET {updates}"""
+    updates = ", ".join(
+        f"{column} = VALUES({column})" for column in LABEL_COLUMNS[label_type]
+    )
+    return f"""INSERT INTO {project_name}_image_{label_type} ({", ".join(columns)})
+        VALUES ({placeholders})
+        ON DUPLICATE KEY UPDATE {updates}"""
+
+
+def save_labels(project_name: str, label_type: str, labels: list[dict]):
+    """Upsert a batch of labels of one type in a single transaction.
+
+    Each label is a dict of ``image_id`` and the label columns of its type.
+    The rows are sent as one multi-row INSERT, and the pending index and
+    progress counters are updated in the same transaction. The transaction
+    holds the pending index lock, so a rebuild reads the table either before
+    or after the write.
+    """
+    if not labels:
+        return
+    columns = ("image_id",) + LABEL_COLUMNS[label_type]
+    image_ids = tuple(label["image_id"] for label in labels)
+
+    # DDL commits implicitly, so the tables are created before the write
+    ensure_pending_index(project_name, label_type)
+    ensure_progress_table()
+    with pending_index_lock(project_name, label_type), Database() as database:
+        database.conn.begin()
+        new_cell_count = count_unlabelled_cells(
+            database, project_name, label_type, image_ids
+        )
+        database.execute_many(
+            upsert_label_sql(project_name, label_type),
+            [tuple(label[column] for column in columns) for label in labels],
+        )
+        remove_pending(database, project_name, label_type, image_ids)
+        add_labelled_cells(database, project_name, label_type, new_cell_count)
+        database.conn.commit()
+    query_cache.invalidate(project_name)
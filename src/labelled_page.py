@@ -3,6 +3,8 @@ import pandas as pd
 import streamlit as st
 
 from src.database import query_database
+from src.label_progress import get_all_progress
+from src.pending_index import LABEL_TYPES
 from src.project_selector import get_project_list
 from src.renderer import TitleRenderer
 
@@ -36,8 +38,22 @@ def create_cell_metadata_table(project_name):
     return data
 
 
+def create_label_progress_table():
+    data = pd.DataFrame(get_all_progress(get_project_list(), LABEL_TYPES))
+    if data.empty:
+        return data
+    data["progress"] = (
+        data["labelled_cell_count"] / data["total_cell_count"] * 100
+    ).round()
+    return data.set_index(["project_name", "label_type"])[
+        ["labelled_cell_count", "total_cell_count", "progress"]
+    ]
+
+
 def app():
     TitleRenderer("Labelled Data Overview").render()
+    st.subheader("Label progress")
+    st.table(create_label_progress_table())
     project_list = get_project_list()
     project_name = st.selectbox("Select Project", project_list)
     st.table(create_cell_metadata_table(f"{project_name}"))
@@ -0,0 +1,82 @@
+from typing import Optional
+
+import numpy as np
+
+NORMALIZE_CHUNK_ELEMENTS = 1 << 20
+PERCENTILE_BINS = 1 << 16
+
+
+def _chunks(img: np.ndarray, chunk_elements=NORMALIZE_CHUNK_ELEMENTS):
+    """Yield slices along the first axis holding about chunk_elements"""
+    row_size = max(1, img[:1].size)
+    rows = max(1, chunk_elements // row_size)
+    for start in range(0, img.shape[0], rows):
+        yield slice(start, start + rows)
+
+
+def value_range(img: np.ndarray) -> tuple[float, float]:
+    """Minimum and maximum in a single chunked pass over the data"""
+    low, high = np.inf, -np.inf
+    for chunk in _chunks(img):
+        low = min(low, img[chunk].min())
+        high = max(high, img[chunk].max())
+    return low, high
+
+
+def percentile_range(
+    img: np.ndarray, percentiles: tuple[float, float], bins=PERCENTILE_BINS
+) -> tuple[float, float]:
+    """Approximate percentiles from a histogram, exact within one bin"""
+    low, high = value_range(img)
+    if low == high:
+        return low, high
+    histogram = np.zeros(bins, dtype=np.int64)
+    for chunk in _chunks(img):
+        histogram += np.histogram(img[chunk], bins=bins, range=(low, high))[0]
+    edges = np.linspace(low, high, bins + 1)
+    cumulative = np.cumsum(histogram) / histogram.sum() * 100
+    return tuple(
+        edges[min(np.searchsorted(cumulative, percentile), bins)]
+        for percentile in percentiles
+    )
+
+
+def normalize_to_uint8(
+    img: np.ndarray,
+    low: Optional[float] = None,
+    high: Optional[float] = None,
+    percentiles: Optional[tuple[float, float]] = None,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Scale img from [low, high] to uint8, chunk by chunk in float32.
+
+    Without bounds the full value range is used, or the given percentiles
+    for windowing. Values outside [low, high] are clipped. The result is
+    written into ``out`` (a new uint8 array if omitted), so only one chunk
+    sized float32 buffer is allocated besides the output.
+    """
+    if (low is None) | (high is None):
+        low, high = (
+            value_range(img)
+            if percentiles is None
+            else percentile_range(img, percentiles)
+        )
+    if out is None:
+        out = np.empty(img.shape, dtype=np.uint8)
+    span = np.float32(high - low) if high > low else np.float32(1)
+
+    buffer = None
+    for chunk in _chunks(img):
+        source = img[chunk]
+        if (buffer is None) or (buffer.shape[0] < source.shape[0]):
+            buffer = np.empty(source.shape, dtype=np.float32)
+        scaled = buffer[: source.shape[0]]
+        # in float32, integer values below low would wrap around
+        np.subtract(
+            source, low, out=scaled, dtype=np.float32, casting="unsafe"
+        )
+        np.divide(scaled, span, out=scaled)
+        np.multiply(scaled, 255, out=scaled)
+        np.clip(scaled, 0, 255, out=scaled)
+        np.copyto(out[chunk], scaled, casting="unsafe")
+    return out
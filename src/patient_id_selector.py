@@ -1,6 +1,6 @@
 import streamlit as st
 
-from src.database import query_database
+from src.cell_index import get_cell_index
 from src.renderer import return_selectbox_result
 
 
@@ -11,12 +11,10 @@ class PatientListRenderer:
         self.data_list = self.get_datalist()
 
     def get_datalist(self):
-        data_list = query_database(
-            f"SELECT patient_id FROM {self.project_name}_patient"
+        return return_selectbox_result(
+            get_cell_index(self.project_name).patient_ids()
         )
 
-        return return_selectbox_result([data["patient_id"] for data in data_list])  # type: ignore
-
     def render(self):
         return st.selectbox(self.name, self.data_list, index=0)
 
@@ -26,43 +24,16 @@ class FilterPatientListRenderer(PatientListRenderer):
         self.label_type = label_type
         super().__init__(name, project_name)
 
-
-class FilterQualityPatientListRenderer(FilterPatientListRenderer):
-    def get_datalist(self):
-        data_list = query_database(
-            f"""SELECT distinct(patient_id) 
-                FROM {self.project_name}_cell 
-                WHERE cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type}))
-            """
-        )
-        return return_selectbox_result(
-            [data["patient_id"] for data in data_list]
-        )
-
-
-class FilterCenterPatientListRenderer(FilterPatientListRenderer):
     def get_datalist(self):
-        data_list = query_database(
-            f"""SELECT distinct(patient_id) 
-                FROM {self.project_name}_cell 
-                WHERE cell_id IN 
-                    (SELECT distinct(cell_id) 
-                    FROM {self.project_name}_image 
-                    WHERE image_id NOT IN (SELECT image_id FROM {self.project_name}_image_{self.label_type}) AND image_type = 'HOLOTOMOGRAPHY')
-            """
-        )
         return return_selectbox_result(
-            [data["patient_id"] for data in data_list]
+            get_cell_index(self.project_name).patient_ids(self.label_type)
         )
 
 
 class PatientListRendererFactory:
     factory_dict = {
-        "quality": FilterQualityPatientListRenderer,
-        "center": FilterCenterPatientListRenderer,
+        "quality": FilterPatientListRenderer,
+        "center": FilterPatientListRenderer,
     }
 
     def get_renderer(
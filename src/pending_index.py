@@ -0,0 +1,205 @@
+"""Index of the images that still need a label, per project and label type.
+
+``{project}_pending_{label_type}`` keeps one row per unlabelled image with
+its cell metadata, indexed on (patient_id, cell_type, cell_number). Saving
+a label deletes its rows. Images imported later and labels written
+elsewhere are picked up by a row count check every
+PENDING_INDEX_RECONCILE_SECONDS, which rebuilds the index when it is off.
+Rebuild it by hand with ``python -m src.pending_index [project_name ...]``.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from src.database import (
+    Database,
+    is_sqlite,
+    list_tables,
+    query_cache,
+    query_database,
+)
+
+LABEL_TYPES = ("quality", "center")
+PENDING_IMAGE_TYPES = {"quality": None, "center": "HOLOTOMOGRAPHY"}
+PENDING_INDEX_RECONCILE_SECONDS = float(
+    os.getenv("PENDING_INDEX_RECONCILE_SECONDS", "600")
+)
+
+# monotonic time of the last check or rebuild per (project, label type)
+_checked_at = {}
+# held across the check and the rebuild, so only one session rebuilds, and
+# by label writes, so a rebuild never swaps in a table missing a new label
+_locks = defaultdict(threading.RLock)
+_locks_lock = threading.Lock()
+
+
+def pending_index_lock(project_name: str, label_type: str):
+    with _locks_lock:
+        return _locks[(project_name, label_type)]
+
+
+def pending_table(project_name: str, label_type: str) -> str:
+    return f"{project_name}_pending_{label_type}"
+
+
+def _select_pending_sql(project_name: str, label_type: str) -> str:
+    image_type = PENDING_IMAGE_TYPES[label_type]
+    image_type_filter = (
+        f"AND i.image_type = '{image_type}'" if image_type is not None else ""
+    )
+    return f"""SELECT i.image_id, c.cell_id, c.patient_id, c.cell_type, c.cell_number
+            FROM {project_name}_image i
+            JOIN {project_name}_cell c
+            ON i.cell_id = c.cell_id
+            LEFT JOIN {project_name}_image_{label_type} l
+            ON i.image_id = l.image_id
+            WHERE l.image_id IS NULL
+            {image_type_filter}"""
+
+
+def pending_table_exists(project_name: str, label_type: str) -> bool:
+    return len(list_tables(pending_table(project_name, label_type))) > 0
+
+
+def rebuild_pending_index(project_name: str, label_type: str):
+    """Recreate the pending index from the image and label tables.
+
+    On MySQL the new table is built aside and swapped in with one RENAME
+    TABLE, so readers never see a partially filled index.
+    """
+    with pending_index_lock(project_name, label_type):
+        logging.info(f"Rebuild {pending_table(project_name, label_type)}")
+        if is_sqlite():
+            _rebuild_pending_index_sqlite(project_name, label_type)
+        else:
+            _rebuild_pending_index_mysql(project_name, label_type)
+        _checked_at[(project_name, label_type)] = time.monotonic()
+    query_cache.invalidate(project_name)
+
+
+def _rebuild_pending_index_mysql(project_name: str, label_type: str):
+    table = pending_table(project_name, label_type)
+    exists = pending_table_exists(project_name, label_type)
+    with Database() as database:
+        database.execute_sql(f"DROP TABLE IF EXISTS {table}_rebuild")
+        database.execute_sql(
+            f"""CREATE TABLE {table}_rebuild (
+                PRIMARY KEY (image_id),
+                INDEX patient_cell (patient_id, cell_type, cell_number)
+            ) AS {_select_pending_sql(project_name, label_type)}"""
+        )
+        if exists:
+            database.execute_sql(f"DROP TABLE IF EXISTS {table}_old")
+            database.execute_sql(
+                f"RENAME TABLE {table} TO {table}_old, {table}_rebuild TO {table}"
+            )
+            database.execute_sql(f"DROP TABLE {table}_old")
+        else:
+            database.execute_sql(f"RENAME TABLE {table}_rebuild TO {table}")
+
+
+def _rebuild_pending_index_sqlite(project_name: str, label_type: str):
+    """SQLite has no RENAME of several tables at once, but its DDL is
+    transactional, so the index is replaced within one transaction.
+    """
+    table = pending_table(project_name, label_type)
+    with Database() as database:
+        database.conn.begin()
+        database.execute_sql(f"DROP TABLE IF EXISTS {table}")
+        database.execute_sql(
+            f"""CREATE TABLE {table} (
+                image_id INTEGER PRIMARY KEY,
+                cell_id INTEGER,
+                patient_id INTEGER,
+                cell_type TEXT,
+                cell_number INTEGER
+            )"""
+        )
+        database.execute_sql(
+            f"""INSERT INTO {table}
+                (image_id, cell_id, patient_id, cell_type, cell_number)
+                {_select_pending_sql(project_name, label_type)}"""
+        )
+        database.execute_sql(
+            f"""CREATE INDEX {table}_patient_cell
+                ON {table} (patient_id, cell_type, cell_number)"""
+        )
+        database.conn.commit()
+
+
+def pending_index_is_stale(project_name: str, label_type: str) -> bool:
+    """Compare the index with the images that have no label now.
+
+    The count and the sum of the image ids differ once images are added or
+    labelled behind the index's back, short of an exact swap.
+    """
+    summary = "COUNT(*) AS image_count, SUM(image_id) AS image_id_sum"
+    expected = query_database(
+        f"""SELECT {summary}
+            FROM ({_select_pending_sql(project_name, label_type)}) t"""
+    )[0]
+    indexed = query_database(
+        f"""SELECT {summary}
+            FROM {pending_table(project_name, label_type)}"""
+    )[0]
+    return (expected["image_count"], expected["image_id_sum"]) != (
+        indexed["image_count"],
+        indexed["image_id_sum"],
+    )
+
+
+def ensure_pending_index(project_name: str, label_type: str):
+    """Build the pending index on first use of a project, and rebuild it
+    when the periodic row count check finds it out of date
+    """
+    with pending_index_lock(project_name, label_type):
+        checked_at = _checked_at.get((project_name, label_type))
+        if (checked_at is not None) and (
+            time.monotonic() - checked_at < PENDING_INDEX_RECONCILE_SECONDS
+        ):
+            return
+        if (not pending_table_exists(project_name, label_type)) or (
+            pending_index_is_stale(project_name, label_type)
+        ):
+            rebuild_pending_index(project_name, label_type)
+        _checked_at[(project_name, label_type)] = time.monotonic()
+
+
+def remove_pending(database: Database, project_name, label_type, image_ids):
+    """Drop labelled images from the index within the caller's transaction"""
+    database.execute_sql(
+        f"DELETE FROM {pending_table(project_name, label_type)} WHERE image_id IN %s",
+        (tuple(image_ids),),
+    )
+
+
+def main():
+    from src.project_selector import get_project_list
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild the pending label index of tomocube projects"
+    )
+    parser.add_argument(
+        "project_names",
+        nargs="*",
+        help="projects to rebuild, all projects if omitted",
+    )
+    parser.add_argument(
+        "--label-type",
+        choices=LABEL_TYPES,
+        action="append",
+        help="label types to rebuild, all label types if omitted",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for project_name in args.project_names or get_project_list():
+        for label_type in args.label_type or LABEL_TYPES:
+            rebuild_pending_index(project_name, label_type)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+from src.image import ImageType, get_images, load_image
+from src.image_cache import Workspace
+from src.storage import get_storage
+
+PREFETCH_COUNT = int(os.getenv("PREFETCH_COUNT", "2"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+
+IMAGE_KEYS = {
+    ImageType.BRIGHT_FIELD: "bf_image",
+    ImageType.MIP: "mip_image",
+    ImageType.HOLOTOMOGRAPHY: "ht_image",
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch"
+)
+
+
+class ImagePrefetcher:
+    """Fetch and decode the images of the next cells in the labelling queue.
+
+    One prefetcher lives in each session. ``schedule`` is called on every
+    rerun with the current cell number list; cells that fall out of the
+    prefetch window are cancelled and their decoded images are dropped.
+    """
+
+    def __init__(
+        self, image_types: tuple[ImageType, ...], count=PREFETCH_COUNT
+    ):
+        self.image_types = image_types
+        self.count = count
+        self.lock = threading.Lock()
+        self.cell_futures: dict[tuple, Future] = {}
+        self.image_futures: dict[tuple, dict[str, Future]] = {}
+        self.cancelled: dict[tuple, threading.Event] = {}
+        self.workspace = Workspace()
+
+    @staticmethod
+    def upcoming_cells(cell_numbers: list, current) -> list:
+        if current in cell_numbers:
+            return cell_numbers[cell_numbers.index(current) + 1 :]
+        return list(cell_numbers)
+
+    def schedule(
+        self, project_name, patient_id, cell_type, cell_numbers, current
+    ):
+        window = [
+            (project_name, patient_id, cell_type, cell_number)
+            for cell_number in self.upcoming_cells(cell_numbers, current)[
+                : self.count
+            ]
+        ]
+        with self.lock:
+            for cell in list(self.cell_futures):
+                if cell not in window:
+                    self._cancel(cell)
+            for cell in window:
+                if cell not in self.cell_futures:
+                    logging.info(f"Prefetch cell {cell}")
+                    self.cancelled[cell] = threading.Event()
+                    self.image_futures[cell] = {}
+                    self.cell_futures[cell] = _executor.submit(
+                        self._prefetch_cell, cell, self.cancelled[cell]
+                    )
+
+    def _cancel(self, cell):
+        logging.info(f"Cancel prefetch of cell {cell}")
+        self.cancelled.pop(cell).set()
+        self.cell_futures.pop(cell).cancel()
+        for google_file_id, future in self.image_futures.pop(cell).items():
+            future.cancel()
+            self.workspace.release(google_file_id)
+
+    def _prefetch_cell(self, cell, cancelled):
+        try:
+            images = get_images(*cell)
+        except Exception:
+            logging.exception(f"Prefetch failed: {cell}")
+            return
+        with self.lock:
+            if cancelled.is_set():
+                return
+            for image_meta, image_type in zip(images, IMAGE_KEYS):
+                if (image_meta is None) | (image_type not in self.image_types):
+                    continue
+                self.image_futures[cell][
+                    image_meta.image_google_id
+                ] = _executor.submit(
+                    self._prefetch_image,
+                    get_storage(cell[0]),
+                    cancelled,
+                    image_meta.image_google_id,
+                    IMAGE_KEYS[image_type],
+                )
+
+    def _prefetch_image(self, storage, cancelled, google_file_id, key):
+        self.workspace.hold(google_file_id, google_file_id)
+        if cancelled.is_set():
+            self.workspace.release(google_file_id)
+            return None
+        image_path = storage.fetch(google_file_id)
+        if cancelled.is_set():
+            return None
+        return load_image(image_path, key)
+
+    def take(self, google_file_id):
+        """Return the prefetched image if it is loaded or being loaded.
+
+        The pool is shared by every session, so nothing queued is waited
+        for: cells whose metadata is not resolved yet are skipped, and an
+        image that has not started is cancelled for the caller to load it
+        in the foreground.
+        """
+        with self.lock:
+            future = next(
+                (
+                    futures[google_file_id]
+                    for futures in self.image_futures.values()
+                    if google_file_id in futures
+                ),
+                None,
+            )
+        if future is None:
+            return None
+        if future.cancel():
+            logging.info(f"Prefetch of {google_file_id} not started yet")
+            return None
+        try:
+            return future.result()
+        except CancelledError:
+            return None
+        except Exception:
+            logging.exception(f"Prefetch failed: {google_file_id}")
+            return None
@@ -1,20 +1,14 @@
 import streamlit as st
 
-from src.database import query_database
+from src.database import list_tables
 from src.renderer import return_selectbox_result
 
 
 def get_project_list():
-    """Get project list based on mysql tables in tomocube database"""
-
-    data_list = query_database(
-        """SELECT TABLE_NAME
-        FROM information_schema.TABLES
-        WHERE TABLE_SCHEMA = 'tomocube'
-        AND TABLE_NAME LIKE '%patient'"""
-    )
+    """Get project list based on the patient tables of the database"""
     return [
-        data["TABLE_NAME"].replace("_patient", "") for data in data_list  # type: ignore
+        table_name.replace("_patient", "")
+        for table_name in list_tables("%patient", cached=True)
     ]
 
 
@@ -1,6 +1,7 @@
 import streamlit as st
 
-from src.database import Database, query_database
+from src.database import query_database
+from src.label_queue import get_label_queue
 
 
 def get_default_quality(project_name, image_id: int, key: str):
@@ -9,13 +10,20 @@ def get_default_quality(project_name, image_id: int, key: str):
     )
     st.session_state[key] = None if data is () else data[0].get("quality")
 
+    queued_label = get_label_queue().pending_label(
+        project_name, "quality", image_id
+    )
+    if queued_label is not None:
+        st.session_state[key] = queued_label["quality"]
+
 
 def save_quality(project_name, image_ids: tuple[int], quality):
-    database = Database()
     num_quality = 0 if quality == "Good" else 1
-    for image_id in image_ids:
-        sql = f"INSERT INTO {project_name}_image_quality (image_id, quality) VALUES ({image_id}, {num_quality}) ON DUPLICATE KEY UPDATE quality = {num_quality}"
-        database.execute_sql(sql)
-    database.conn.commit()
-    database.conn.close()
-
+    get_label_queue().put(
+        project_name,
+        "quality",
+        [
+            {"image_id": image_id, "quality": num_quality}
+            for image_id in image_ids
+        ],
+    )
@@ -1,11 +1,16 @@
 import streamlit as st
 
 from src.cell_selector import render_cell_selector
-from src.gdrive import GDriveCredential, GDriveDownloader
-from src.image import TomocubeImage, download_image, get_images
+from src.image import ImageType, TomocubeImage, download_image, get_images
+from src.prefetch import ImagePrefetcher
 from src.quality import get_default_quality, save_quality
-from src.renderer import LabelProgressRenderer, TitleRenderer
+from src.renderer import (
+    LabelProgressRenderer,
+    PendingLabelRenderer,
+    TitleRenderer,
+)
 from src.session import set_session_state
+from src.storage import get_storage
 
 
 def render_image_quality(quality: int) -> None:
@@ -36,8 +41,11 @@ def app():
         "bf_quality",
         "mip_quality",
     )
+    if "quality_prefetcher" not in st.session_state:
+        st.session_state["quality_prefetcher"] = ImagePrefetcher(
+            (ImageType.BRIGHT_FIELD, ImageType.MIP)
+        )
 
-    downloader = GDriveDownloader(GDriveCredential().credentials)
     TitleRenderer("Tomocube Image Quality Labeller").render()
 
     render_cell_selector(label_type="quality")
@@ -51,6 +59,7 @@ def app():
         )
         return
 
+    storage = get_storage(st.session_state["quality_project_name"])
     bf_cellimage, mip_cellimage, ht_cellimage = get_images(
         st.session_state["quality_project_name"],
         st.session_state["quality_patient_id"],
@@ -61,11 +70,10 @@ def app():
     if bf_cellimage != st.session_state["bf_image_meta"]:
         if bf_cellimage is not None:
             download_image(
-                downloader,
+                storage,
                 bf_cellimage.image_google_id,
-                "image",
-                "bf.tiff",
                 "bf_image",
+                st.session_state["quality_prefetcher"],
             )
             st.session_state["bf_image_meta"] = bf_cellimage
             get_default_quality(
@@ -79,11 +87,10 @@ def app():
     if mip_cellimage != st.session_state["mip_image_meta"]:
         if mip_cellimage is not None:
             download_image(
-                downloader,
+                storage,
                 mip_cellimage.image_google_id,
-                "image",
-                "mip.tiff",
                 "mip_image",
+                st.session_state["quality_prefetcher"],
             )
             st.session_state["mip_image_meta"] = mip_cellimage
             st.session_state["ht_image_meta_quality"] = ht_cellimage
@@ -95,6 +102,14 @@ def app():
         else:
             st.session_state["mip_image"] = None
 
+    st.session_state["quality_prefetcher"].schedule(
+        st.session_state["quality_project_name"],
+        st.session_state["quality_patient_id"],
+        st.session_state["quality_cell_type"],
+        st.session_state["quality_cell_number_list"],
+        st.session_state["quality_cell_number"],
+    )
+
     col1, col2 = st.columns(2)
     with col1:
         if st.session_state["bf_image"] is None:
@@ -165,3 +180,4 @@ def app():
         LabelProgressRenderer(
             st.session_state["quality_project_name"], "quality"
         ).render()
+        PendingLabelRenderer(st.session_state["quality_project_name"]).render()
@@ -2,7 +2,9 @@ from typing import Protocol
 
 import streamlit as st
 
-from src.database import query_database
+from src.label_progress import count_queued_labelled_cells, get_progress
+from src.label_queue import get_label_queue
+from src.slice_cache import slice_cache
 
 
 def return_selectbox_result(lst):
@@ -35,21 +37,18 @@ class LabelProgressRenderer:
     def __init__(self, project_name, label_type):
         self.project_name = project_name
         self.label_type = label_type
-        self.total_cell_count = self.get_total_cell_count()
-        self.total_labelled_cell_count = self.get_labelled_cell_count()
-
-    def get_labelled_cell_count(self):
-        return query_database(
-            f"""SELECT count(distinct(i.cell_id)) as cell_count 
-                FROM {self.project_name}_image_{self.label_type} q 
-                LEFT JOIN {self.project_name}_image i 
-                ON q.image_id = i.image_id"""
-        )[0].get("cell_count")
-
-    def get_total_cell_count(self) -> int:
-        return query_database(f"SELECT COUNT(*) FROM {self.project_name}_cell")[
-            0
-        ].get("COUNT(*)")
+        progress = get_progress(self.project_name, self.label_type)
+        self.total_cell_count = progress["total_cell_count"]
+        # labels waiting in the queue count as soon as they are saved
+        queued_image_ids = get_label_queue().queued_image_ids(
+            self.project_name, self.label_type
+        )
+        queued_cell_count = count_queued_labelled_cells(
+            self.project_name, self.label_type, queued_image_ids
+        )
+        self.total_labelled_cell_count = (
+            progress["labelled_cell_count"] + queued_cell_count
+        )
 
     def render(self):
         st.write("The number of labeled cell:", self.total_labelled_cell_count)
@@ -61,3 +60,39 @@ class LabelProgressRenderer:
             f"Progress: {self.total_labelled_cell_count / self.total_cell_count * 100:.0f}%"
         )
         st.progress(self.total_labelled_cell_count / self.total_cell_count)
+
+
+class PendingLabelRenderer:
+    def __init__(self, project_name):
+        self.label_queue = get_label_queue()
+        self.pending_count = self.label_queue.pending_count(project_name)
+
+    def render(self):
+        if self.pending_count > 0:
+            st.write("Labels waiting to be saved:", self.pending_count)
+        if self.label_queue.last_error is not None:
+            st.warning(
+                f"Saving labels failed, retrying: {self.label_queue.last_error}"
+            )
+
+
+class SliceCacheRenderer:
+    def __init__(self):
+        self.hits = slice_cache.hits
+        self.total = slice_cache.hits + slice_cache.misses
+        self.hit_rate = slice_cache.hit_rate
+
+    def render(self):
+        if self.total > 0:
+            st.caption(
+                f"Slice cache hit rate: {self.hit_rate * 100:.0f}% ({self.hits}/{self.total})"
+            )
+
+
+class RerunTimingRenderer:
+    def __init__(self):
+        self.timings = dict(st.session_state.get("rerun_timings", {}))
+
+    def render(self):
+        for name, elapsed in self.timings.items():
+            st.caption(f"Last {name} rerun: {elapsed * 1000:.0f} ms")
@@ -0,0 +1,41 @@
+import logging
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+# st.fragment needs Streamlit 1.37 or newer, which the lock file pins. On
+# older installs the panels simply render inline as part of the full rerun
+_fragment = getattr(st, "fragment", None) or getattr(
+    st, "experimental_fragment", None
+)
+
+
+def fragment(func):
+    """Rerun func on its own when a widget inside it changes"""
+    return _fragment(func) if _fragment is not None else func
+
+
+def rerun_app():
+    """Rerun the whole page after a change made inside a fragment.
+
+    Without fragments the widget already triggered a full rerun.
+    """
+    if _fragment is None:
+        return
+    rerun = getattr(st, "rerun", None) or st.experimental_rerun
+    rerun()
+
+
+@contextmanager
+def timed(name: str):
+    """Record how long a (full or fragment) rerun of name took"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if "rerun_timings" not in st.session_state:
+            st.session_state["rerun_timings"] = {}
+        st.session_state["rerun_timings"][name] = elapsed
+        logging.info(f"{name} rerun took {elapsed * 1000:.0f} ms")
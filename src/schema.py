@@ -0,0 +1,168 @@
+"""Tables of a tomocube project and the indexes its queries rely on.
+
+Every project has ``{project}_patient``, ``{project}_cell``,
+``{project}_image`` and one ``{project}_image_{label_type}`` table per label
+type. ``PROJECT_INDEXES`` lists the composite indexes behind the cell
+lookups, the cell index and the pending index rebuild; the SQLite schema is
+created with them, and MySQL databases are checked against them.
+
+Copy projects from MySQL into a local SQLite database with
+``python -m src.schema project_name [...] [--sqlite-path tomocube.sqlite]``
+and run the app with ``DATABASE_BACKEND=sqlite``.
+"""
+import argparse
+import logging
+from dataclasses import dataclass
+
+import pymysql
+
+from src.database import (
+    SQLITE_DATABASE_PATH,
+    ConnectionPool,
+    SQLiteConnection,
+)
+from src.pending_index import LABEL_TYPES
+
+SCHEMA_LOAD_BATCH_SIZE = 10000
+
+# column name and SQLite type, the first column is the primary key
+PROJECT_TABLES = {
+    "patient": (("patient_id", "INTEGER"), ("project_id", "INTEGER")),
+    "cell": (
+        ("cell_id", "INTEGER"),
+        ("patient_id", "INTEGER"),
+        ("cell_type", "TEXT"),
+        ("cell_number", "INTEGER"),
+    ),
+    "image": (
+        ("image_id", "INTEGER"),
+        ("cell_id", "INTEGER"),
+        ("patient_id", "INTEGER"),
+        ("image_type", "TEXT"),
+        ("google_drive_file_id", "TEXT"),
+    ),
+    "image_quality": (("image_id", "INTEGER"), ("quality", "INTEGER")),
+    "image_center": (
+        ("image_id", "INTEGER"),
+        ("x", "INTEGER"),
+        ("y", "INTEGER"),
+        ("z", "INTEGER"),
+    ),
+}
+
+
+@dataclass(frozen=True)
+class Index:
+    table: str
+    name: str
+    columns: tuple
+    unique: bool = False
+
+    def table_name(self, project_name: str) -> str:
+        return f"{project_name}_{self.table}"
+
+    def index_name(self, project_name: str) -> str:
+        # SQLite index names share one namespace across tables
+        return f"{self.table_name(project_name)}_{self.name}"
+
+
+PROJECT_INDEXES = (
+    # cell lookup by (patient, type, number) and the ordered cell index
+    Index("cell", "patient_cell", ("patient_id", "cell_type", "cell_number")),
+    # images of a cell, and of one type for the pending index rebuild
+    Index("image", "cell_image_type", ("cell_id", "image_type")),
+) + tuple(
+    # label joins and the upsert of labels by image_id
+    Index(f"image_{label_type}", "image_id", ("image_id",), unique=True)
+    for label_type in LABEL_TYPES
+)
+
+
+def create_table_sql(project_name: str, table: str) -> str:
+    columns = PROJECT_TABLES[table]
+    definitions = [f"{columns[0][0]} {columns[0][1]} PRIMARY KEY"] + [
+        f"{column} {column_type}" for column, column_type in columns[1:]
+    ]
+    return f"""CREATE TABLE IF NOT EXISTS {project_name}_{table} (
+        {", ".join(definitions)}
+    )"""
+
+
+def create_index_sql(project_name: str, index: Index) -> str:
+    unique = "UNIQUE " if index.unique else ""
+    return f"""CREATE {unique}INDEX IF NOT EXISTS {index.index_name(project_name)}
+        ON {index.table_name(project_name)} ({", ".join(index.columns)})"""
+
+
+def create_project_tables(conn: SQLiteConnection, project_name: str):
+    """Create the SQLite tables and indexes of a project if missing"""
+    cursor = conn.cursor()
+    for table in PROJECT_TABLES:
+        cursor.execute(create_table_sql(project_name, table))
+    for index in PROJECT_INDEXES:
+        # the primary key already indexes the label tables
+        if index.columns != (PROJECT_TABLES[index.table][0][0],):
+            cursor.execute(create_index_sql(project_name, index))
+
+
+def load_project(mysql_pool: ConnectionPool, conn, project_name: str):
+    """Copy the known columns of a project from MySQL into SQLite.
+
+    Each table is replaced in one transaction, streamed in batches of
+    SCHEMA_LOAD_BATCH_SIZE rows so large projects are not held in memory.
+    """
+    create_project_tables(conn, project_name)
+    mysql_conn = mysql_pool.acquire()
+    try:
+        for table, columns in PROJECT_TABLES.items():
+            column_names = ", ".join(column for column, _ in columns)
+            table_name = f"{project_name}_{table}"
+            placeholders = ", ".join(["%s"] * len(columns))
+            with mysql_conn.cursor(pymysql.cursors.SSCursor) as mysql_cursor:
+                mysql_cursor.execute(
+                    f"SELECT {column_names} FROM {table_name}"
+                )
+                cursor = conn.cursor()
+                conn.begin()
+                try:
+                    cursor.execute(f"DELETE FROM {table_name}")
+                    count = 0
+                    while True:
+                        rows = mysql_cursor.fetchmany(SCHEMA_LOAD_BATCH_SIZE)
+                        if not rows:
+                            break
+                        cursor.executemany(
+                            f"""INSERT INTO {table_name} ({column_names})
+                                VALUES ({placeholders})""",
+                            rows,
+                        )
+                        count += len(rows)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            logging.info(f"Loaded {count} rows into {table_name}")
+    finally:
+        mysql_pool.release(mysql_conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Copy tomocube projects from MySQL into a local SQLite database"
+    )
+    parser.add_argument("project_name", nargs="+")
+    parser.add_argument("--sqlite-path", default=SQLITE_DATABASE_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    mysql_pool = ConnectionPool(size=1)
+    conn = SQLiteConnection(args.sqlite_path)
+    try:
+        for project_name in args.project_name:
+            load_project(mysql_pool, conn, project_name)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
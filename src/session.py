@@ -1,7 +1,16 @@
 import streamlit as st
 
+from src.image_cache import Workspace
+
 
 def set_session_state(*args):
     for arg in args:
         if arg not in st.session_state:
             st.session_state[arg] = None
+
+
+def get_workspace() -> Workspace:
+    """Return the image workspace of the current session"""
+    if "workspace" not in st.session_state:
+        st.session_state["workspace"] = Workspace()
+    return st.session_state["workspace"]
@@ -0,0 +1,108 @@
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+from streamlit_custom_image_labeller import encode_atlas, encode_image
+
+from src.image import TomocubeImage
+from src.volume import PageCache
+
+SLICE_CACHE_BYTES = int(os.getenv("SLICE_CACHE_BYTES", str(64 * 1024**2)))
+CENTER_CANVAS_WIDTH = int(os.getenv("CENTER_CANVAS_WIDTH", "512"))
+CENTER_STACK_WIDTH = int(os.getenv("CENTER_STACK_WIDTH", "256"))
+
+
+class SliceRenderCache(PageCache):
+    """LRU cache of PNG encoded slices shared by every session.
+
+    Entries are keyed by (google file id, axis, index, pyramid factor), so
+    scrubbing back to a slice that was shown before skips slicing, casting
+    and encoding it again.
+    """
+
+    def __init__(self, max_bytes=SLICE_CACHE_BYTES):
+        super().__init__(max_bytes, sizeof=len)
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render) -> bytes:
+        encoded = self.get(key)
+        with self.stats_lock:
+            if encoded is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if encoded is None:
+            encoded = render()
+            self.put(key, encoded)
+        return encoded
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+
+slice_cache = SliceRenderCache()
+
+
+def pyramid_factor(size: int, max_size=CENTER_CANVAS_WIDTH) -> int:
+    """Smallest power of two downsampling that fits size into max_size"""
+    factor = 1
+    while -(-size // factor) > max_size:
+        factor *= 2
+    return factor
+
+
+def to_display(voxel: int, factor: int) -> int:
+    return voxel // factor
+
+
+def to_voxel(display: int, factor: int, size: int) -> int:
+    """Map a display pixel to the voxel at the center of the block it covers"""
+    return min(max(display, 0) * factor + factor // 2, size - 1)
+
+
+def _reduce_slice(image, idx: int, axis: int, factor: int) -> Image.Image:
+    img = TomocubeImage.numpy_to_image(
+        TomocubeImage.slice_axis(image, idx, axis).astype(np.uint8, copy=False)
+    )
+    if factor > 1:
+        # box filter: display pixel i covers voxels [i * factor, (i + 1) * factor)
+        img = img.reduce(factor)
+    return img
+
+
+def _encode_slice(image, idx: int, axis: int, factor: int) -> bytes:
+    return encode_image(_reduce_slice(image, idx, axis, factor))
+
+
+def _encode_stack(image, axis: int, factor: int) -> bytes:
+    return encode_atlas(
+        np.stack(
+            [
+                np.asarray(_reduce_slice(image, idx, axis, factor))
+                for idx in range(image.shape[axis])
+            ]
+        )
+    )
+
+
+def render_slice(
+    image, google_file_id: str, idx: int, axis: int, factor=1
+) -> bytes:
+    """Return the slice as PNG bytes, downsampled by the pyramid factor"""
+    return slice_cache.get_or_render(
+        (google_file_id, axis, idx, factor),
+        lambda: _encode_slice(image, idx, axis, factor),
+    )
+
+
+def render_stack(image, google_file_id: str, axis: int, factor=1) -> bytes:
+    """Return every slice along axis as one PNG atlas for the browser"""
+    return slice_cache.get_or_render(
+        (google_file_id, axis, "stack", factor),
+        lambda: _encode_stack(image, axis, factor),
+    )
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Optional, Protocol
+
+from src.drive_index import get_drive_index
+from src.gdrive import GDriveDownloaderPool, get_downloader_pool
+from src.image_cache import ImageCache, image_cache
+
+# <LOCAL_IMAGE_DIR>/<project_name>/<file id> is read from disk instead of Drive
+LOCAL_IMAGE_DIR = os.getenv("LOCAL_IMAGE_DIR")
+
+
+class StorageBackend(Protocol):
+    def stat(self, file_id: str) -> dict:
+        """Return id, size, md5Checksum and modifiedTime of the file"""
+        ...
+
+    def fetch(self, file_id: str) -> Path:
+        """Return a local path of the file"""
+        ...
+
+    def open(self, file_id: str) -> BinaryIO:
+        ...
+
+
+class GDriveStorage:
+    """Google Drive files downloaded through the local image cache"""
+
+    def __init__(
+        self, downloader: GDriveDownloaderPool, cache: ImageCache = image_cache
+    ):
+        self.downloader = downloader
+        self.cache = cache
+
+    def stat(self, file_id: str) -> dict:
+        return self.downloader.get_metadata(file_id)
+
+    def fetch(self, file_id: str) -> Path:
+        return self.cache.fetch(self.downloader, file_id)
+
+    def open(self, file_id: str) -> BinaryIO:
+        return open(self.fetch(file_id), "rb")
+
+
+class LocalStorage:
+    """Files read in place from a local or NFS mounted directory.
+
+    The file id stored in the project tables is the file name under root.
+    Nothing is copied, and md5Checksum is left out of ``stat`` since it
+    would mean reading the whole file.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, file_id: str) -> Path:
+        path = Path(self.root, file_id)
+        if self.root.resolve() not in path.resolve().parents:
+            raise ValueError(f"{file_id} is outside of {self.root}")
+        return path
+
+    def stat(self, file_id: str) -> dict:
+        stat = self.path(file_id).stat()
+        modified_time = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+        return {
+            "id": file_id,
+            "size": stat.st_size,
+            "md5Checksum": None,
+            "modifiedTime": modified_time.isoformat(
+                timespec="milliseconds"
+            ).replace("+00:00", "Z"),
+        }
+
+    def fetch(self, file_id: str) -> Path:
+        path = self.path(file_id)
+        if not path.exists():
+            raise FileNotFoundError(path)
+        return path
+
+    def open(self, file_id: str) -> BinaryIO:
+        return open(self.fetch(file_id), "rb")
+
+
+def get_storage(project_name: Optional[str]) -> StorageBackend:
+    """Read a project from LOCAL_IMAGE_DIR when it has a directory there"""
+    if (LOCAL_IMAGE_DIR is not None) and (project_name is not None):
+        project_dir = Path(LOCAL_IMAGE_DIR, project_name)
+        if project_dir.is_dir():
+            return LocalStorage(project_dir)
+    downloader = get_downloader_pool()
+    # Drive metadata is read from the local index, kept fresh in background
+    get_drive_index().start_sync(downloader)
+    return GDriveStorage(downloader)
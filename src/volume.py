@@ -0,0 +1,291 @@
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import imagecodecs
+import numpy as np
+import tifffile
+
+from src.image_cache import image_cache
+from src.normalize import normalize_to_uint8, value_range
+
+HT_PAGE_CACHE_BYTES = int(
+    os.getenv("HT_PAGE_CACHE_BYTES", str(512 * 1024**2))
+)
+HT_CHUNK_SIZE = int(os.getenv("HT_CHUNK_SIZE", "64"))
+HT_CHUNK_CACHE_BYTES = int(
+    os.getenv("HT_CHUNK_CACHE_BYTES", str(256 * 1024**2))
+)
+
+
+class PageCache:
+    """LRU cache bounded by the total size of its values.
+
+    Holds the decoded pages and chunks shared by every open volume; sizeof
+    measures a value, ``nbytes`` of an array by default.
+    """
+
+    def __init__(
+        self, max_bytes=HT_PAGE_CACHE_BYTES, sizeof=lambda page: page.nbytes
+    ):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.lock = threading.Lock()
+        self.pages = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            page = self.pages.get(key)
+            if page is not None:
+                self.pages.move_to_end(key)
+            return page
+
+    def put(self, key, page):
+        with self.lock:
+            if key in self.pages:
+                return
+            self.pages[key] = page
+            self.size += self.sizeof(page)
+            while (self.size > self.max_bytes) & (len(self.pages) > 1):
+                _, evicted = self.pages.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+
+
+page_cache = PageCache()
+chunk_cache = PageCache(HT_CHUNK_CACHE_BYTES)
+
+_value_ranges = {}
+_value_ranges_lock = threading.Lock()
+
+
+class HTVolume:
+    """Holotomography TIFF read page by page, the source of a ChunkedVolume.
+
+    Pages are read through a memory map when the TIFF is stored uncompressed
+    and contiguously, and through the shared page cache otherwise. Opening
+    the volume reads every page once for the value range that ``convert``
+    normalizes the stack with.
+    """
+
+    def __init__(self, image_path: Path):
+        self.image_path = Path(image_path)
+        stat = self.image_path.stat()
+        self.key = (str(self.image_path), stat.st_mtime_ns, stat.st_size)
+        self.lock = threading.Lock()
+        self.tiff = tifffile.TiffFile(str(self.image_path))
+        series = self.tiff.series[0]
+        self.shape = tuple(series.shape)
+        self.ndim = len(self.shape)
+        self.pages = series.pages
+        try:
+            self.memmap = tifffile.memmap(str(self.image_path), mode="r")
+        except ValueError:
+            self.memmap = None
+        self.min, self.max = self._value_range()
+
+    @classmethod
+    def is_supported(cls, image_path: Path) -> bool:
+        with tifffile.TiffFile(str(image_path)) as tiff:
+            series = tiff.series[0]
+            return (len(series.shape) == 3) and (
+                len(series.pages) == series.shape[0]
+            )
+
+    def page(self, z: int) -> np.ndarray:
+        if self.memmap is not None:
+            return self.memmap[z]
+        key = self.key + (z,)
+        page = page_cache.get(key)
+        if page is None:
+            with self.lock:
+                page = self.pages[z].asarray()
+            page_cache.put(key, page)
+        return page
+
+    def _value_range(self):
+        with _value_ranges_lock:
+            bounds = _value_ranges.get(self.key)
+        if bounds is None:
+            # one pass over the stack without holding all of it in memory
+            page_ranges = [
+                value_range(self.page(z)) for z in range(self.shape[0])
+            ]
+            bounds = (
+                min(page_min for page_min, _ in page_ranges),
+                max(page_max for _, page_max in page_ranges),
+            )
+            with _value_ranges_lock:
+                _value_ranges[self.key] = bounds
+        return bounds
+
+    def close(self):
+        self.tiff.close()
+
+
+class ChunkedVolume:
+    """Holotomography stack stored as zstd compressed uint8 cubes.
+
+    The volume is normalized and split into ``chunk_size`` cubes once, in a
+    ``<image>.chunks`` directory next to a cached TIFF, or in the image
+    cache for TIFFs read in place from local storage. A slice along any axis
+    decodes only the cubes crossing that plane, so YZ and XZ slices cost
+    about as much as XY slices.
+
+    The directory is an entry of the image cache, counted against its size
+    and evicted with the TIFF. An open volume holds the entry so it is not
+    evicted while it is read.
+    """
+
+    meta_filename = "meta.json"
+
+    def __init__(self, chunk_dir: Path):
+        self.chunk_dir = Path(chunk_dir)
+        # held before reading, so no process evicts the chunks under us
+        self.entry = image_cache.entry_name(self.chunk_dir)
+        image_cache.acquire(self.entry)
+        self._finalizer = weakref.finalize(
+            self, image_cache.release, self.entry
+        )
+        with open(Path(self.chunk_dir, self.meta_filename)) as f:
+            meta = json.load(f)
+        self.key = tuple(meta["source"])
+        self.shape = tuple(meta["shape"])
+        self.ndim = len(self.shape)
+        self.chunk_shape = tuple(meta["chunk_shape"])
+
+    @staticmethod
+    def chunk_dir_of(image_path: Path) -> Path:
+        image_path = Path(image_path).resolve()
+        if image_path.parent == image_cache.cache_dir.resolve():
+            return image_path.with_name(f"{image_path.name}.chunks")
+        # never write next to files on shared storage
+        digest = hashlib.sha1(str(image_path).encode()).hexdigest()[:16]
+        return Path(image_cache.cache_dir, "local", f"{digest}.chunks")
+
+    @classmethod
+    def from_tiff(cls, image_path: Path, chunk_size=HT_CHUNK_SIZE):
+        """Open the chunked copy of a TIFF, converting it on first use"""
+        chunk_dir = cls.chunk_dir_of(image_path)
+        # one conversion at a time, also across the app and predownload.py
+        with image_cache.file_lock(chunk_dir.name):
+            stat = Path(image_path).stat()
+            source = [str(image_path), stat.st_mtime_ns, stat.st_size]
+            if Path(chunk_dir, cls.meta_filename).exists():
+                volume = cls(chunk_dir)
+                if list(volume.key) == source:
+                    image_cache.touch(volume.entry)
+                    return volume
+                volume.close()
+            cls.convert(image_path, chunk_dir, source, chunk_size)
+            volume = cls(chunk_dir)
+            image_cache.store_derived(chunk_dir)
+            return volume
+
+    @classmethod
+    def convert(cls, image_path, chunk_dir: Path, source, chunk_size):
+        tmp_dir = chunk_dir.with_name(f"{chunk_dir.name}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        volume = HTVolume(image_path)
+        try:
+            chunk_shape = (chunk_size,) * volume.ndim
+            for z in range(0, volume.shape[0], chunk_size):
+                # one slab of pages at a time keeps the memory use flat
+                slab = normalize_to_uint8(
+                    np.stack(
+                        [
+                            volume.page(page)
+                            for page in range(
+                                z, min(z + chunk_size, volume.shape[0])
+                            )
+                        ]
+                    ),
+                    volume.min,
+                    volume.max,
+                )
+                for x, y in itertools.product(
+                    range(0, volume.shape[1], chunk_size),
+                    range(0, volume.shape[2], chunk_size),
+                ):
+                    chunk = slab[:, x : x + chunk_size, y : y + chunk_size]
+                    block = (
+                        z // chunk_size,
+                        x // chunk_size,
+                        y // chunk_size,
+                    )
+                    with open(Path(tmp_dir, cls.chunk_name(block)), "wb") as f:
+                        f.write(
+                            imagecodecs.zstd_encode(
+                                np.ascontiguousarray(chunk)
+                            )
+                        )
+            shape = volume.shape
+        finally:
+            volume.close()
+
+        with open(Path(tmp_dir, cls.meta_filename), "w") as f:
+            json.dump(
+                {
+                    "source": source,
+                    "shape": shape,
+                    "chunk_shape": chunk_shape,
+                },
+                f,
+            )
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        os.replace(tmp_dir, chunk_dir)
+
+    @staticmethod
+    def chunk_name(block: tuple) -> str:
+        return ".".join(str(index) for index in block)
+
+    def chunk(self, block: tuple) -> np.ndarray:
+        key = self.key + block
+        chunk = chunk_cache.get(key)
+        if chunk is None:
+            shape = tuple(
+                min(size, total - index * size)
+                for index, size, total in zip(
+                    block, self.chunk_shape, self.shape
+                )
+            )
+            with open(Path(self.chunk_dir, self.chunk_name(block)), "rb") as f:
+                chunk = np.frombuffer(
+                    imagecodecs.zstd_decode(f.read()), dtype=np.uint8
+                ).reshape(shape)
+            chunk_cache.put(key, chunk)
+        return chunk
+
+    def take(self, indices: int, axis: int) -> np.ndarray:
+        out_axes = [dim for dim in range(self.ndim) if dim != axis]
+        out = np.empty([self.shape[dim] for dim in out_axes], dtype=np.uint8)
+        block_ranges = [
+            range(0, -(-self.shape[dim] // self.chunk_shape[dim]))
+            for dim in out_axes
+        ]
+        for out_block in itertools.product(*block_ranges):
+            block = list(out_block)
+            block.insert(axis, indices // self.chunk_shape[axis])
+            chunk = self.chunk(tuple(block))
+            region = tuple(
+                slice(
+                    index * self.chunk_shape[dim],
+                    index * self.chunk_shape[dim] + chunk.shape[dim],
+                )
+                for index, dim in zip(out_block, out_axes)
+            )
+            out[region] = chunk.take(
+                indices=indices % self.chunk_shape[axis], axis=axis
+            )
+        return out
+
+    def close(self):
+        self._finalizer()
@@ -1,7 +1,11 @@
+import base64
+import io
+import math
 from pathlib import Path
 
 import numpy as np
 import streamlit.components.v1 as components
+from PIL import Image
 
 _RELEASE = True
 
@@ -18,14 +22,58 @@ else:
     )
 
 
+def encode_image(img: Image.Image, format="PNG") -> bytes:
+    """Encode an image for the component, keeping single channel images"""
+    if img.mode not in ("L", "RGB", "RGBA"):
+        img = img.convert("RGBA")
+    buffer = io.BytesIO()
+    # fast zlib level: slices are re-encoded on every rerun
+    img.save(buffer, format=format, compress_level=1)
+    return buffer.getvalue()
+
+
+def to_data_url(encoded: bytes) -> tuple[str, int, int]:
+    """Return the data URL and the size of PNG or WebP bytes"""
+    # only the header is parsed here, the browser decodes the pixels
+    img = Image.open(io.BytesIO(encoded))
+    mime_type = Image.MIME[img.format]
+    data = base64.b64encode(encoded).decode("ascii")
+    return f"data:{mime_type};base64,{data}", img.width, img.height
+
+
+def atlas_columns(slice_count: int) -> int:
+    return math.ceil(math.sqrt(slice_count))
+
+
+def encode_atlas(stack: np.ndarray, format="PNG") -> bytes:
+    """Tile a (slices, height, width) stack row by row into one image"""
+    slice_count, height, width = stack.shape
+    columns = atlas_columns(slice_count)
+    rows = math.ceil(slice_count / columns)
+    tiles = np.zeros((rows * columns, height, width), dtype=stack.dtype)
+    tiles[:slice_count] = stack
+    atlas = (
+        tiles.reshape(rows, columns, height, width)
+        .transpose(0, 2, 1, 3)
+        .reshape(rows * height, columns * width)
+    )
+    return encode_image(Image.fromarray(atlas), format=format)
+
+
 def st_custom_image_labeller(
-    resized_img, point_color="blue", point=None, key=None
+    resized_img,
+    point_color="blue",
+    point=None,
+    key=None,
+    slice_count=None,
+    slice_index=0,
 ):
     """Create a new instance of "st_img_label".
     Parameters
     ----------
-    img_file: PIL.Image
-        The image to be croppepd
+    resized_img: PIL.Image or bytes
+        The image to be labelled, or the image already encoded as PNG or
+        WebP bytes. It is sent to the frontend as a data URL.
     point_color: string
         The color of the pointer's point. Defaults to blue.
     rects: list
@@ -34,17 +82,27 @@ def st_custom_image_labeller(
         An optional key that uniquely identifies this component. If this is
         None, and the component's arguments are changed, the component will
         be re-mounted in the Streamlit frontend and lose its current state.
+    slice_count: int or None
+        Stack mode. resized_img is an atlas from encode_atlas holding
+        slice_count slices, which the annotator scrolls in the browser.
+        The slice is reported once a scroll settles.
+    slice_index: int
+        The slice shown first in stack mode.
     Returns
     -------
     points: list
-        list of points.
+        list of points. In stack mode it also holds the "index" of the
+        slice shown, which is the slice the point is on.
     """
     # Get arguments to send to frontend
-    canvasWidth = resized_img.width
-    canvasHeight = resized_img.height
+    if isinstance(resized_img, Image.Image):
+        resized_img = encode_image(resized_img)
+    imageUrl, canvasWidth, canvasHeight = to_data_url(resized_img)
+    if slice_count is not None:
+        columns = atlas_columns(slice_count)
+        canvasWidth //= columns
+        canvasHeight //= math.ceil(slice_count / columns)
 
-    # Translates image to a list for passing to Javascript
-    imageData = np.array(resized_img.convert("RGBA")).flatten().tolist()
     if point is None:
         point_x = canvasWidth // 2
         point_y = canvasHeight // 2
@@ -63,11 +121,15 @@ def st_custom_image_labeller(
         canvasHeight=canvasHeight,
         point={"x": point_x, "y": point_y},
         pointColor=point_color,
-        imageData=imageData,
+        imageUrl=imageUrl,
+        sliceCount=slice_count,
+        sliceIndex=slice_index,
         key=key,
     )
     # Return a cropped image using the box from the frontend
     if component_value:
         return component_value
+    elif slice_count is not None:
+        return {"x": point_x, "y": point_y, "index": slice_index}
     else:
         return {"x": point_x, "y": point_y}
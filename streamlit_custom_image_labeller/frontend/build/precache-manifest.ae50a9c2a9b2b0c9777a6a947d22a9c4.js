@@ -17,7 +17,7 @@ self.__precacheManifest = (self.__precacheManifest || []).concat([
   },
   {
     "revision": "32a1c30b95d2504d814a",
-    "url": "./static/js/main.7473f046.chunk.js"
+    "url": "./static/js/main.72560bf3.chunk.js"
   },
   {
     "revision": "06fac48652c87345da77",
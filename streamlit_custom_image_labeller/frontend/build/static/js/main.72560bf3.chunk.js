@@ -0,0 +1,2 @@
+(this.webpackJsonpstreamlit_custom_image_labeller=this.webpackJsonpstreamlit_custom_image_labeller||[]).push([[0],{12:function(e,t,a){e.exports={dark:"StreamlitImgLabel_dark__PyW4C"}},13:function(e,t,a){e.exports=a(29)},26:function(e,t){},27:function(e,t){},28:function(e,t){},29:function(e,t,a){"use strict";a.r(t);var n=a(3),c=a.n(n),r=a(10),i=a.n(r),o=a(2),l=a(1),s=a(7),u=a(8),g=a(12),m=a.n(g),d=function(e,t,a,n,c){var i=new u.fabric.Canvas("canvas",{height:t,width:e,backgroundImage:a});return i=function(e,t,a){var n=new u.fabric.Circle({radius:3,fill:a,left:t.x,top:t.y,selectable:!0,originX:"center",originY:"center",hoverCursor:"auto",lockScalingX:!0,lockScalingY:!0});return e.add(n),e}(i,n,c)},f=function(e,t,a,n,c){return new u.fabric.Image(e,{cropX:t%a*n,cropY:Math.floor(t/a)*c,width:n,height:c})},b=Object(s.b)((function(e){var t=e.args,a=t.canvasWidth,r=t.canvasHeight,i=t.imageUrl,g=t.sliceCount,u=e.args.pointColor,b=Object(n.useState)("light"),h=Object(l.a)(b,2),v=h[0],p=Object(n.useState)({x:e.args.point.x,y:e.args.point.y}),j=Object(l.a)(p,2),O=j[0],k=j[1],x=Object(n.useState)(e.args.sliceIndex||0),_=Object(l.a)(x,2),E=_[0],w=_[1],y=Object(n.useState)(null),C=Object(l.a)(y,2),I=C[0],S=C[1],N=Math.ceil(Math.sqrt(g||1)),P=g?I?f(I,E,N,a,r):"":i,D=Object(n.useState)((function(){return d(a,r,P,O,u)})),M=Object(l.a)(D,2),L=M[0],T=M[1];return L.on("mouse:down",(function(e){k(Object(o.a)(Object(o.a)({},O),{},{x:e.e.clientX,y:e.e.clientY}))})),L.on("mouse:wheel",(function(e){g&&(e.e.preventDefault(),w(Math.min(Math.max(E+Math.sign(e.e.deltaY),0),g-1)))})),Object(n.useEffect)((function(){if(g){var e=new Image;e.onload=function(){S(e)},e.src=i}}),[i,g]),Object(n.useEffect)((function(){g&&w(e.args.sliceIndex||0)}),[e.args.sliceIndex]),Object(n.useEffect)((function(){g&&(e.args.point.x!==O.x||e.args.point.y!==O.y)&&k({x:e.args.point.x,y:e.args.point.y})}),[e.args.point.x,e.args.point.y]),Object(n.useEffect)((function(){T(d(a,r,P,O,u)),s.a.setFrameHeight()}),[O,i,E,I]),Object(n.useEffect)((function(){var e=setTimeout((function(){s.a.setComponentValue(g?{x:O.x,y:O.y,index:E}:{x:O.x,y:O.y})}),g?150:0);return function(){return clearTimeout(e)}}),[O,E]),c.a.createElement(c.a.Fragment,null,c.a.createElement("canvas",{id:"canvas",className:"dark"===v?m.a.dark:"",width:a,height:r}),g?c.a.createElement("div",null,c.a.createElement("input",{type:"range",min:0,max:g-1,value:E,style:{width:a},onChange:function(e){w(Number(e.target.value))}}),c.a.createElement("span",null," ",E)):null)}));i.a.render(c.a.createElement(c.a.StrictMode,null,c.a.createElement(b,null)),document.getElementById("root"))}},[[13,1,2]]]);
+//# sourceMappingURL=main.72560bf3.chunk.js.map
\ No newline at end of file
@@ -1,2 +0,0 @@
-(this.webpackJsonpstreamlit_custom_image_labeller=this.webpackJsonpstreamlit_custom_image_labeller||[]).push([[0],{12:function(e,t,a){e.exports={dark:"StreamlitImgLabel_dark__PyW4C"}},13:function(e,t,a){e.exports=a(29)},26:function(e,t){},27:function(e,t){},28:function(e,t){},29:function(e,t,a){"use strict";a.r(t);var n=a(3),c=a.n(n),r=a(10),i=a.n(r),o=a(2),l=a(1),s=a(7),u=a(8),g=a(12),m=a.n(g),d=function(e,t,a,n,c){var r=function(e,t,a){var n,c=document.createElement("canvas");c.width=e,c.height=t;var r=c.getContext("2d");if(r){var i=r.createImageData(e,t);i.data.set(a),r.putImageData(i,0,0),n=c.toDataURL()}else n="";return n}(e,t,a),i=new u.fabric.Canvas("canvas",{height:t,width:e,backgroundImage:r});return i=function(e,t,a){var n=new u.fabric.Circle({radius:3,fill:a,left:t.x,top:t.y,selectable:!0,originX:"center",originY:"center",hoverCursor:"auto",lockScalingX:!0,lockScalingY:!0});return e.add(n),e}(i,n,c)},b=Object(s.b)((function(e){var t=e.args,a=t.canvasWidth,r=t.canvasHeight,i=t.imageData,u=e.args.pointColor,g=Object(n.useState)("light"),b=Object(l.a)(g,2),f=b[0],h=(b[1],Object(n.useState)({x:e.args.point.x,y:e.args.point.y})),v=Object(l.a)(h,2),p=v[0],j=v[1],O=Object(n.useState)(d(a,r,i,p,u)),k=Object(l.a)(O,2),x=k[0],_=k[1];return x.on("mouse:down",(function(e){j(Object(o.a)(Object(o.a)({},p),{},{x:e.e.clientX,y:e.e.clientY})),console.log(p)})),Object(n.useEffect)((function(){_(d(a,r,i,p,u)),s.a.setFrameHeight(),s.a.setComponentValue({x:p.x,y:p.y})}),[p,i]),c.a.createElement(c.a.Fragment,null,c.a.createElement("canvas",{id:"canvas",className:"dark"===f?m.a.dark:"",width:a,height:r}))}));i.a.render(c.a.createElement(c.a.StrictMode,null,c.a.createElement(b,null)),document.getElementById("root"))}},[[13,1,2]]]);
-//# sourceMappingURL=main.7473f046.chunk.js.map
\ No newline at end of file
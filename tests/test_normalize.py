@@ -0,0 +1,30 @@
+import numpy as np
+
+from src.normalize import normalize_to_uint8, percentile_range
+
+
+def test_integer_input_is_clipped_to_explicit_bounds():
+    img = np.array([[0, 10, 100, 200, 300]], dtype=np.uint16)
+    out = normalize_to_uint8(img, low=100, high=200)
+    np.testing.assert_array_equal(out, [[0, 0, 0, 255, 255]])
+
+
+def test_integer_input_is_clipped_to_percentile_bounds():
+    img = np.arange(1000, dtype=np.uint16).reshape(10, 100)
+    low, high = percentile_range(img, (10, 90))
+    out = normalize_to_uint8(img, percentiles=(10, 90))
+    assert out.dtype == np.uint8
+    assert (out[img <= low] == 0).all()
+    assert (out[img >= high] == 255).all()
+    # inside the window the scaling keeps the order of the values
+    inside = out[(img > low) & (img < high)]
+    assert (np.diff(inside.astype(int)) >= 0).all()
+
+
+def test_full_range_matches_float_reference():
+    img = np.random.default_rng(0).integers(-500, 3000, (64, 64), np.int16)
+    expected = (
+        (img.astype(np.float64) - img.min()) / (img.max() - img.min()) * 255
+    ).astype(np.uint8)
+    out = normalize_to_uint8(img)
+    assert np.abs(out.astype(int) - expected).max() <= 1
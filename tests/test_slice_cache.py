@@ -0,0 +1,39 @@
+import pytest
+
+from src.slice_cache import pyramid_factor, to_display, to_voxel
+
+
+@pytest.mark.parametrize(
+    "size, max_size, factor",
+    [(512, 512, 1), (513, 512, 2), (1024, 512, 2), (1025, 512, 4), (1, 1, 1)],
+)
+def test_pyramid_factor_is_smallest_power_of_two_that_fits(
+    size, max_size, factor
+):
+    assert pyramid_factor(size, max_size) == factor
+    assert -(-size // factor) <= max_size
+    if factor > 1:
+        assert -(-size // (factor // 2)) > max_size
+
+
+@pytest.mark.parametrize("size, factor", [(1001, 4), (97, 8), (64, 1)])
+def test_display_pixel_maps_to_voxel_inside_its_block(size, factor):
+    display_size = -(-size // factor)
+    for display in range(display_size):
+        voxel = to_voxel(display, factor, size)
+        assert display * factor <= voxel < min((display + 1) * factor, size)
+        assert to_display(voxel, factor) == display
+
+
+@pytest.mark.parametrize("size, factor", [(1001, 4), (97, 8), (64, 1)])
+def test_voxel_round_trip_stays_in_its_display_pixel(size, factor):
+    for voxel in range(size):
+        display = to_display(voxel, factor)
+        assert to_display(to_voxel(display, factor, size), factor) == display
+
+
+def test_to_voxel_clamps_at_the_last_partial_block_and_outside_the_slice():
+    # 1001 voxels in blocks of 4: the last display pixel covers voxel 1000
+    assert to_voxel(250, 4, 1001) == 1000
+    assert to_voxel(251, 4, 1001) == 1000
+    assert to_voxel(-3, 4, 1001) == 2
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import tifffile
+
+import src.volume
+from src.image_cache import ImageCache
+from src.normalize import normalize_to_uint8
+from src.volume import ChunkedVolume
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ImageCache(tmp_path / "cache")
+    monkeypatch.setattr(src.volume, "image_cache", cache)
+    return cache
+
+
+@pytest.mark.parametrize(
+    "shape, chunk_size", [((10, 13, 7), 4), ((5, 6, 9), 8), ((3, 4, 5), 1)]
+)
+def test_take_matches_ndarray_take(tmp_path, cache, shape, chunk_size):
+    data = np.random.default_rng(0).integers(0, 4000, shape, np.uint16)
+    image_path = tmp_path / "ht.tiff"
+    tifffile.imwrite(str(image_path), data, photometric="minisblack")
+    expected = normalize_to_uint8(data, data.min(), data.max())
+
+    volume = ChunkedVolume.from_tiff(image_path, chunk_size=chunk_size)
+    try:
+        assert volume.shape == shape
+        for axis in range(3):
+            for index in range(shape[axis]):
+                np.testing.assert_array_equal(
+                    volume.take(indices=index, axis=axis),
+                    expected.take(indices=index, axis=axis),
+                )
+    finally:
+        volume.close()
+
+
+def test_reopened_volume_reads_the_converted_chunks(tmp_path, cache):
+    data = np.arange(2 * 3 * 5, dtype=np.uint16).reshape(2, 3, 5)
+    image_path = tmp_path / "ht.tiff"
+    tifffile.imwrite(str(image_path), data, photometric="minisblack")
+
+    ChunkedVolume.from_tiff(image_path, chunk_size=2).close()
+    volume = ChunkedVolume.from_tiff(image_path, chunk_size=2)
+    try:
+        np.testing.assert_array_equal(
+            volume.take(indices=4, axis=2),
+            normalize_to_uint8(data, 0, data.max()).take(indices=4, axis=2),
+        )
+    finally:
+        volume.close()